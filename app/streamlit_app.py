@@ -40,11 +40,15 @@ if ROOT not in sys.path:
 import streamlit as st
 import json as _json
 
-from pipeline.ingest import process_episode
-from pipeline.align import assign_speakers, sentences_from_words
-from pipeline.chunk import time_aware_windows
-from pipeline.embed_index import upsert_episode, get_chroma
+from pipeline.jobs import get_job_queue
+from pipeline.worker import ensure_worker
+from pipeline.embed_index import get_index, list_episodes
 from pipeline.retrieve import Retriever
+from pipeline.localize import localize
+from pipeline.whisper_pool import whisper_stats
+from pipeline.embed_cache import get_embedding_cache
+from pipeline.metrics import summarize
+from pipeline.startup import start_warmup, readiness
 from app.components import ts_to_mmss
 
 
@@ -58,20 +62,27 @@ st.title("🎙️ Audio-to-Text RAG for Podcast Search")
 # =========================
 # Helpers (cached)
 # =========================
+@st.cache_resource(show_spinner=False)
+def _warmup():
+    """Once per server process: load models / open stores in the background, not in the first query."""
+    return start_warmup()
+
+
+_warmup()
+
+
 @st.cache_resource(show_spinner=False)
 def _get_retriever(rerank: bool):
     """Cache Retriever (downloads models once)."""
     return Retriever(rerank=rerank)
 
 
-def _safe_json_load(path: Path):
-    with open(path, "r", encoding="utf-8") as f:
-        return _json.load(f)
-
-
 # Ensure session state keys exist
 st.session_state.setdefault("recent_eids", [])
 st.session_state.setdefault("scope_choice", "All episodes")  # will flip to "Recent upload(s)" after indexing
+if "pending_scope" in st.session_state:
+    # set before the radio widget exists on this run
+    st.session_state["scope_choice"] = st.session_state.pop("pending_scope")
 
 
 # =========================
@@ -111,79 +122,81 @@ with st.sidebar:
 
             os.makedirs("storage/data", exist_ok=True)
 
-            new_eids = []  # collect episode IDs indexed in this run
-
-            with st.spinner("Processing episodes..."):
-                ok_count, err_count = 0, 0
-                for f in upl:
-                    try:
-                        raw_path = Path("storage/data") / f.name
-                        with open(raw_path, "wb") as w:
-                            w.write(f.read())
-
-                        ep_json_path, ep_id = process_episode(raw_path, titles.get(f.name, f.name))
-                        data = _safe_json_load(Path(ep_json_path))
-
-                        # Assign speakers, build sentences and time-aware windows
-                        words = assign_speakers(data["words"], data["turns"])  # turns may be [] if diarization off
-                        sents = sentences_from_words(words)
-                        chunks = time_aware_windows(sents)
-
-                        # Minimal metadata carried into the index
-                        meta = {
-                            "episode_id": data["episode_id"],
-                            "episode_title": data["episode_title"],
-                        }
-                        # replace=True ensures re-indexing the SAME episode_id overwrites only its own chunks
-                        upsert_episode(chunks, meta, replace=True)
-
-                        new_eids.append(data["episode_id"])
-                        ok_count += 1
-                    except Exception as ee:
-                        err_count += 1
-                        st.warning(f"Failed to index {f.name}: {ee}")
-
-            if ok_count and not err_count:
-                st.success(f"Indexed {ok_count} episode(s). Go search ➡️", icon="✅")
-            elif ok_count and err_count:
-                st.info(f"Indexed {ok_count} episode(s), {err_count} failed. Check logs.", icon="ℹ️")
-            else:
-                st.error("No episodes were indexed. Please check the logs.", icon="❌")
+            # Save uploads and queue them; the worker process transcribes + indexes,
+            # so a rerun or closed tab doesn't kill the work
+            jobs = get_job_queue()
+            job_ids = []
+            for f in upl:
+                raw_path = Path("storage/data") / f.name
+                with open(raw_path, "wb") as w:
+                    w.write(f.read())
+                job_ids.append(jobs.enqueue(raw_path, titles.get(f.name, f.name)))
 
-            # 🚀 Default future searches to the episodes just indexed
-            if new_eids:
-                st.session_state["recent_eids"] = new_eids
-                st.session_state["scope_choice"] = "Recent upload(s)"
+            st.session_state["job_ids"] = job_ids
+            ensure_worker()
+            st.success(f"Queued {len(job_ids)} episode(s). Indexing runs in the background.", icon="⏳")
 
         except Exception as e:
             st.exception(e)
 
 
+@st.fragment(run_every=2)
+def _job_status():
+    """Poll the queued jobs of this session (fragment rerun only, not the whole page)."""
+    job_ids = st.session_state.get("job_ids") or []
+    if not job_ids:
+        return
+    jobs = get_job_queue().get(job_ids)
+    if any(j["state"] == "queued" for j in jobs):
+        ensure_worker()  # the previous worker may have idled out meanwhile
+    for j in jobs:
+        st.progress(j["progress"], text=f"{j['title']}: {j['stage'] or 'queued'} ({j['state']})")
+        if j["state"] == "failed":
+            st.warning(f"Failed to index {j['title']}: {j['error']}")
+        elif j["state"] == "queued" and j["error"]:
+            st.caption(f"Retrying {j['title']} after: {j['error']}")
+    if jobs and all(j["state"] in ("done", "failed") for j in jobs):
+        st.session_state["job_ids"] = []
+        new_eids = [j["episode_id"] for j in jobs if j["state"] == "done" and j["kind"] == "ingest"]
+        if new_eids:
+            # 🚀 Default future searches to the episodes just indexed (applied on the full rerun)
+            st.session_state["recent_eids"] = new_eids
+            st.session_state["pending_scope"] = "Recent upload(s)"
+            st.rerun()
+
+
+with st.sidebar:
+    _job_status()
+
 st.divider()
 st.header("🔎 Search across episodes")
 
+_ready = readiness()
+if not _ready["ready"]:
+    _loading = [k for k, v in _ready["steps"].items() if v["state"] in ("pending", "loading")]
+    _failed = [k for k, v in _ready["steps"].items() if v["state"] == "failed"]
+    if _loading:
+        st.caption("Warming up: " + ", ".join(_loading) + " (searches wait for it if needed)")
+    if _failed:
+        st.caption("Warm-up failed for " + ", ".join(_failed) + "; it will be retried on first use")
+
 # Determine current index size to cap slider and avoid noisy logs
 try:
-    _coll = get_chroma()  # collection handle
+    _coll = get_index()  # collection handle
     _N = int(_coll.count()) if _coll else 0
 except Exception:
     _N = 0
 
-# Precompute episode counts and id->title mapping once (used by Index status and scope picker)
+# Episode counts and id->title mapping from the catalog (O(episodes), cached per index version)
 episodes_counts = {}
 id_to_title = {}
+episode_info = {}
 try:
     if _N > 0:
-        _got = _coll.get(include=["metadatas"], limit=5000)
-        for m in (_got.get("metadatas") or []):
-            if not m:
-                continue
-            eid = m.get("episode_id")
-            if not eid:
-                continue
-            episodes_counts[eid] = episodes_counts.get(eid, 0) + 1
-            if eid not in id_to_title:
-                id_to_title[eid] = m.get("episode_title", "(untitled)")
+        for ep in list_episodes():
+            episodes_counts[ep["episode_id"]] = ep["chunk_count"]
+            id_to_title[ep["episode_id"]] = ep["title"] or "(untitled)"
+            episode_info[ep["episode_id"]] = ep
 except Exception:
     pass
 
@@ -191,6 +204,26 @@ except Exception:
 with st.expander("Index status"):
     try:
         st.json({"total_chunks": _N, "by_episode": episodes_counts})
+        _ecache = get_embedding_cache()
+        if _ecache is not None:
+            st.caption("Embedding cache")
+            st.json(_ecache.stats())
+        _wstats = whisper_stats()
+        if _wstats:
+            st.caption("Whisper model pool (load vs decode seconds)")
+            st.json(_wstats)
+        st.caption("Startup warm-up")
+        st.json(readiness()["steps"])
+        _timings = summarize()
+        if _timings:
+            st.caption("Pipeline timings (recent runs, all processes)")
+            st.dataframe(
+                [{"stage": k, "runs": v["count"], "p50 s": v["p50_s"], "p95 s": v["p95_s"],
+                  "cpu s (mean)": v["cpu_mean_s"], "RSS MB": v["rss_mb"], "RSS growth MB": v["rss_delta_mb"],
+                  "throughput /s": ", ".join(f"{i}: {r}" for i, r in v["per_second"].items())}
+                 for k, v in _timings.items()],
+                hide_index=True, use_container_width=True,
+            )
         # (Optional) wipe the index for a clean slate
         st.markdown("**Danger zone**")
         c1, c2 = st.columns([1, 1])
@@ -199,8 +232,11 @@ with st.expander("Index status"):
         with c2:
             if st.button("Wipe index", disabled=not confirm):
                 try:
-                    _coll.delete(where={})  # delete everything
-                    st.success("Index cleared. Re-index episodes.")
+                    # the worker does it, so it never races an ingest that is writing
+                    st.session_state["job_ids"] = (st.session_state.get("job_ids") or []) + [
+                        get_job_queue().enqueue("", "Wipe index", kind="wipe")]
+                    ensure_worker()
+                    st.success("Index wipe queued. Re-index episodes once it is done.")
                     st.stop()
                 except Exception as e:
                     st.exception(e)
@@ -250,8 +286,27 @@ with colB:
             st.info("No episodes indexed yet.")
             scope_count = 0
 
+    # Speaker / time filters (pushed down to the index, not post-filtered)
+    if chosen_eid:
+        scope_eids = [chosen_eid]
+    elif chosen_eids:
+        scope_eids = chosen_eids
+    else:
+        scope_eids = list(episode_info)
+    speaker_options = sorted({s for e in scope_eids for s in episode_info.get(e, {}).get("speakers", [])})
+    chosen_speakers = []
+    if len(speaker_options) > 1:
+        chosen_speakers = st.multiselect("Speakers", speaker_options, key="speaker_filter")
+    time_range = None
+    duration = float(episode_info.get(chosen_eid, {}).get("duration", 0.0)) if chosen_eid else 0.0
+    if duration > 60:
+        minutes = int(duration // 60) + 1
+        lo, hi = st.slider("Minutes", 0, minutes, (0, minutes), key="time_filter")
+        if (lo, hi) != (0, minutes):
+            time_range = (lo * 60.0, hi * 60.0)
+
     # Rerank toggle
-    rerank = st.toggle("Re-rank (better precision)", value=False)
+    rerank = st.toggle("Re-rank (better precision)", value=True)
 
     # Results slider capped to scope size
     if scope_count <= 1:
@@ -286,7 +341,8 @@ with colA:
 
                     top_for_retrieval = min(15, scope_count)
                     retriever = _get_retriever(rerank=rerank)
-                    hits = retriever.search(query, k=top_for_retrieval, out_k=k, filters=filters)
+                    hits = retriever.search(query, k=top_for_retrieval, out_k=k, filters=filters,
+                                            speaker=chosen_speakers or None, time_range=time_range)
 
                 if not hits:
                     st.info("No matches found for the current scope.")
@@ -298,6 +354,9 @@ with colA:
                                 f"⏱️ {ts_to_mmss(meta.get('start_time', 0))} – "
                                 f"{ts_to_mmss(meta.get('end_time', 0))}"
                             )
+                            spot = localize((hid, text, meta), query)
+                            if spot:
+                                st.markdown(f"▶️ **{ts_to_mmss(spot['start'])}** — “{spot['text']}”")
                             st.write(text)
 
                             spk_meta = meta.get("speakers_json") or meta.get("speakers")
@@ -0,0 +1,252 @@
+# bench/run.py
+"""
+Benchmarks for the ingestion and retrieval hot paths, on synthetic data.
+
+    python -m bench.run                                  # stub models, writes storage/bench/latest.json
+    python -m bench.run --save-baseline                  # ... and stores it as bench/baseline.json
+    python -m bench.run --compare bench/baseline.json    # fails (exit 1) on regressions
+    python -m bench.run --models real --words 100000     # real MiniLM / ms-marco models
+
+Everything runs in a temporary working directory (fresh index, caches off,
+metrics off) so runs are comparable. Stub models keep it offline; they time
+the pipeline around the model, not the model itself.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def _stats(times, items=None) -> dict:
+    t = np.asarray(times, dtype=np.float64)
+    out = {
+        "median_s": round(float(np.median(t)), 6),
+        "p95_s": round(float(np.percentile(t, 95)), 6),
+        "min_s": round(float(t.min()), 6),
+        "repeats": len(t),
+    }
+    if items:
+        out["items"] = items
+        out["items_per_s"] = round(items / float(np.median(t)), 1)
+    return out
+
+
+def measure(fn, repeats: int, warmup: int = 1, items=None) -> dict:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return _stats(times, items)
+
+
+def bench_ingest(args, results):
+    from pipeline.align import assign_speakers, sentences_from_words
+    from pipeline.chunk import time_aware_windows
+    from bench.synthetic import words_and_turns
+
+    words, turns = words_and_turns(args.words, seed=args.seed)
+    results["assign_speakers"] = measure(lambda: assign_speakers(words, turns), args.repeats, items=len(words))
+    results["sentences_from_words"] = measure(lambda: sentences_from_words(words), args.repeats, items=len(words))
+    sents = sentences_from_words(words)
+    results["time_aware_windows"] = measure(lambda: time_aware_windows(sents), args.repeats, items=len(sents))
+    return time_aware_windows(sents)
+
+
+def bench_embed(args, results, chunks):
+    from pipeline.embedder import get_embedding_service
+
+    svc = get_embedding_service()
+    texts = [c["text"] for c in chunks]
+    for bs in args.batch_sizes:
+        results[f"embed_bs{bs}"] = measure(lambda: svc.encode(texts, batch_size=bs), args.repeats, items=len(texts))
+
+
+def fresh_store(backend: str):
+    """
+    Switch to an empty storage directory and drop every cached store handle, so a
+    backend's numbers don't include the previous backend's index, catalog or BM25 rows.
+    """
+    from pipeline import embed_index, lexical, retrieve
+
+    if embed_index._CLIENT is not None:
+        embed_index._CLIENT._system.stop()
+        embed_index._CLIENT.clear_system_cache()
+    if embed_index._META is not None:
+        embed_index._META.close()
+    if lexical._INDEX is not None:
+        lexical._INDEX._conn.close()
+    os.chdir(tempfile.mkdtemp(prefix=f"{backend}-", dir=os.getcwd()))
+    os.environ["INDEX_BACKEND"] = backend
+    embed_index._COLL = embed_index._CLIENT = embed_index._RETIRED = embed_index._SEEN = None
+    embed_index._INDEX = embed_index._META = None
+    embed_index._CATALOG = (None, [], {})
+    lexical._INDEX = None
+    retrieve._RESULTS.clear()
+    retrieve._QUERY_VECS.clear()
+    retrieve._RESULTS_VERSION = None
+
+
+def bench_index(args, results, chunks, backend):
+    from pipeline import retrieve
+    from pipeline.embed_index import upsert_episode
+    from pipeline.retrieve import Retriever
+    from pipeline.rerank import get_reranker
+    from bench.synthetic import queries
+
+    fresh_store(backend)
+    n_eps = max(1, args.episodes)
+    per_ep = [chunks[i::n_eps] for i in range(n_eps)]
+    for e, ep_chunks in enumerate(per_ep):
+        upsert_episode(ep_chunks, {"episode_id": f"ep{e}", "episode_title": f"Episode {e}"})
+    # steady-state re-index of one episode (delete + embed + write + lexical + catalog)
+    results[f"upsert_{backend}"] = measure(
+        lambda: upsert_episode(per_ep[0], {"episode_id": "ep0", "episode_title": "Episode 0"}),
+        args.repeats, items=len(per_ep[0]))
+
+    qs = queries(args.queries, seed=args.seed + 1)
+    reranker = get_reranker()
+    modes = [("rerank_off", False, None), ("rerank_cascade", True, None), ("rerank_all", True, "1")]
+    for name, rerank, gap in modes:
+        if gap is None:
+            os.environ.pop("RERANK_GAP", None)
+        else:
+            os.environ["RERANK_GAP"] = gap
+        r = Retriever(rerank=rerank)
+        for scope, filters in (("all", None), ("episode", {"episode_id": "ep0"})):
+            def one(q):
+                # cold path every time: no result / query-vector / score cache hits
+                retrieve._RESULTS.clear()
+                retrieve._QUERY_VECS.clear()
+                reranker._scores.clear()
+                t0 = time.perf_counter()
+                r.search(q, k=args.k, out_k=args.out_k, filters=filters)
+                return time.perf_counter() - t0
+            one(qs[0])
+            results[f"query_{backend}_{name}_{scope}"] = _stats([one(q) for q in qs])
+    os.environ.pop("RERANK_GAP", None)
+
+    def batch():
+        retrieve._RESULTS.clear()
+        retrieve._QUERY_VECS.clear()
+        reranker._scores.clear()
+        Retriever(rerank=True).search_many(qs, k=args.k, out_k=args.out_k)
+    results[f"search_many_{backend}"] = measure(batch, args.repeats, items=len(qs))
+
+
+def install_stubs():
+    from pipeline.embedder import get_embedding_service
+    from pipeline.rerank import get_reranker
+    from bench.synthetic import StubEncoder, StubCrossEncoder
+
+    get_embedding_service()._model = StubEncoder()
+    get_reranker()._model = StubCrossEncoder()
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Rows (name, baseline s, current s, ratio, verdict) for benchmarks in both runs."""
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            continue
+        ratio = cur["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+        verdict = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "same"
+        rows.append((name, base["median_s"], cur["median_s"], ratio, verdict))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark ingestion and retrieval hot paths.")
+    ap.add_argument("--words", type=int, default=50000, help="synthetic transcript length")
+    ap.add_argument("--episodes", type=int, default=4, help="episodes the chunks are split into")
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--k", type=int, default=15)
+    ap.add_argument("--out-k", type=int, default=6)
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--batch-sizes", type=lambda s: [int(x) for x in s.split(",")], default=[16, 32, 64, 128])
+    ap.add_argument("--backends", default="numpy,chroma", help="index backends to benchmark")
+    ap.add_argument("--models", choices=["stub", "real"], default="stub")
+    ap.add_argument("--out", default=os.path.join("storage", "bench", "latest.json"),
+                    help="report path (kept out of the source tree by default)")
+    ap.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative slowdown counted as a regression")
+    ap.add_argument("--save-baseline", action="store_true", help=f"also write {os.path.join('bench', 'baseline.json')}")
+    args = ap.parse_args(argv)
+    out_path = os.path.abspath(args.out)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # isolated storage; caches and metrics off so every run measures the same work
+    os.environ["EMBED_CACHE"] = "0"
+    os.environ["METRICS"] = "0"
+    workdir = tempfile.mkdtemp(prefix="podcast-rag-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)  # each backend then gets its own subdirectory (fresh_store)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    results = {}
+    try:
+        if args.models == "stub":
+            install_stubs()
+        chunks = bench_ingest(args, results)
+        bench_embed(args, results, chunks)
+        for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            if backend == "chroma":
+                try:
+                    import chromadb  # noqa: F401
+                except ImportError:
+                    print("chromadb not installed; skipping the chroma backend")
+                    continue
+            os.chdir(workdir)
+            bench_index(args, results, chunks, backend)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "save_baseline")},
+        "env": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                "cpus": os.cpu_count()},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        shutil.copyfile(out_path, os.path.join(HERE, "baseline.json"))
+
+    for name, r in results.items():
+        rate = f"  {r['items_per_s']:>12,.0f} items/s" if "items_per_s" in r else ""
+        print(f"{name:40s} median {r['median_s'] * 1000:9.3f} ms  p95 {r['p95_s'] * 1000:9.3f} ms{rate}")
+    print(f"Wrote {out_path}")
+
+    if compare_path:
+        with open(compare_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Note: baseline was recorded with a different configuration")
+        rows = compare(report, baseline, args.threshold)
+        print(f"\n{'benchmark':40s} {'baseline':>11s} {'current':>11s} {'ratio':>7s}")
+        for name, b, c, ratio, verdict in rows:
+            print(f"{name:40s} {b * 1000:9.3f}ms {c * 1000:9.3f}ms {ratio:7.2f}  {verdict}")
+        if any(r[4] == "slower" for r in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
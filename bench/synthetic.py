@@ -0,0 +1,71 @@
+# bench/synthetic.py
+"""Seeded synthetic transcripts and offline stand-ins for the models."""
+import zlib
+
+import numpy as np
+
+_VOCAB = (
+    "the model data we think really transfer learning episode podcast question answer "
+    "speaker audio whisper vector search index chunk token window embedding rerank "
+    "latency throughput python numpy batch cache query result guest host today about"
+).split()
+
+
+def words_and_turns(n_words: int, n_speakers: int = 3, seed: int = 0):
+    """
+    Word dicts (start/end/text, ~2.5 words/s, a sentence end every ~12 words) and
+    diarization turns of 5-60 s that occasionally overlap, like pyannote output.
+    """
+    rng = np.random.default_rng(seed)
+    gaps = rng.uniform(0.05, 0.5, n_words)
+    durs = rng.uniform(0.15, 0.45, n_words)
+    starts = np.cumsum(gaps + durs) - durs
+    ends = starts + durs
+    vocab = np.array(_VOCAB)
+    texts = vocab[rng.integers(0, len(vocab), n_words)].tolist()
+    for i in np.flatnonzero(rng.random(n_words) < 1 / 12).tolist():
+        texts[i] += rng.choice([".", "?", "!"])
+    words = [{"start": round(float(s), 3), "end": round(float(e), 3), "text": t}
+             for s, e, t in zip(starts, ends, texts)]
+
+    turns, t, total = [], 0.0, float(ends[-1]) if n_words else 0.0
+    while t < total:
+        length = float(rng.uniform(5, 60))
+        start = max(0.0, t - float(rng.uniform(0, 2)) if rng.random() < 0.2 else t)
+        turns.append({"speaker": f"SPEAKER_{int(rng.integers(n_speakers)):02d}", "start": round(start, 3),
+                      "end": round(t + length, 3)})
+        t += length + float(rng.uniform(0, 1.5))
+    return words, turns
+
+
+def queries(n: int, seed: int = 1) -> list:
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(_VOCAB, int(rng.integers(2, 6)))) for _ in range(n)]
+
+
+class StubEncoder:
+    """SentenceTransformer stand-in: deterministic hashed vectors, no download."""
+
+    tokenizer = None
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, show_progress_bar=False, convert_to_numpy=True):
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            out[i] = np.random.default_rng(zlib.crc32(t.encode("utf-8"))).standard_normal(self.dim)
+        if normalize_embeddings:
+            out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out
+
+
+class StubCrossEncoder:
+    """CrossEncoder stand-in: word-overlap score per (query, text) pair."""
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        return np.array([len(set(q.split()) & set(d.lower().split())) / (1 + len(q.split()))
+                         for q, d in pairs], dtype=np.float32)
@@ -0,0 +1,224 @@
+# eval/run_eval.py
+"""
+Retrieval-quality evaluation over labeled questions.
+
+eval/dataset.jsonl, one example per line:
+    {"question": "...", "episode_id": "3f2a9c0d1e4b", "start": 754.0, "end": 790.0}
+
+For every chunking config (target_tokens x overlap) the indexed episodes are
+re-chunked from their transcripts (storage/data/<episode_id>.arrow) into a
+throwaway index; then every (k, out_k, rerank) combination runs each question
+through Retriever.search and reports:
+
+    recall       a returned hit overlaps the labeled time range (same episode)
+    mrr          1 / rank of the first such hit
+    ts_hit       the first such hit starts within --tolerance s of the labeled start
+    episode_hit  any returned hit is from the labeled episode
+    p50/p95 ms   per-query latency, caches cleared before each query
+    chunks / index_mb
+
+    python eval/run_eval.py --k 5,10,15 --out-k 3,6 --rerank 0,1 --min-recall 0.8
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import numpy as np
+
+
+def _floats(s):
+    return [float(x) for x in s.split(",")]
+
+
+def _ints(s):
+    return [int(x) for x in s.split(",")]
+
+
+def load_dataset(path) -> list:
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            ex = json.loads(line)
+            if "timestamp" in ex and "start" not in ex:
+                ex["start"], ex["end"] = ex["timestamp"]
+            missing = {"question", "episode_id", "start", "end"} - set(ex)
+            if missing:
+                raise ValueError(f"{path}:{n}: missing {sorted(missing)}")
+            examples.append(ex)
+    return examples
+
+
+def score(hits, ex, tolerance: float) -> dict:
+    """Per-question quality for one returned hit list."""
+    rank = None
+    for i, (_, _, meta) in enumerate(hits, 1):
+        if meta.get("episode_id") != ex["episode_id"]:
+            continue
+        if meta.get("start_time", 0.0) <= ex["end"] and meta.get("end_time", 0.0) >= ex["start"]:
+            rank = i
+            break
+    first = hits[rank - 1][2] if rank else None
+    return {
+        "recall": 1.0 if rank else 0.0,
+        "mrr": 1.0 / rank if rank else 0.0,
+        "ts_hit": 1.0 if first and abs(first.get("start_time", 0.0) - ex["start"]) <= tolerance else 0.0,
+        "episode_hit": 1.0 if any(m.get("episode_id") == ex["episode_id"] for _, _, m in hits) else 0.0,
+    }
+
+
+def _reset_stores():
+    """Forget the process-wide store handles so the next call opens the current directory's."""
+    from pipeline import embed_index, lexical, retrieve
+
+    embed_index._INDEX = embed_index._COLL = embed_index._META = None
+    embed_index._CATALOG = (None, [], {})
+    lexical._INDEX = None
+    retrieve._RESULTS.clear()
+
+
+def _dir_mb(path) -> float:
+    total = 0
+    for base, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(base, f)) for f in files)
+    return round(total / (1 << 20), 2)
+
+
+def build_index(transcripts, target_tokens: int, overlap: float) -> int:
+    from pipeline.align import sentences_from_transcript
+    from pipeline.chunk import time_aware_windows, default_token_counter
+    from pipeline.embed_index import upsert_episode
+
+    n = 0
+    for tr in transcripts:
+        chunks = time_aware_windows(sentences_from_transcript(tr), target_tokens, overlap,
+                                    token_counter=default_token_counter())
+        upsert_episode(chunks, {"episode_id": tr.episode_id, "episode_title": tr.episode_title})
+        n += len(chunks)
+    return n
+
+
+def run_grid(examples, transcripts, args) -> list:
+    from pipeline import retrieve
+    from pipeline.retrieve import Retriever
+    from pipeline.rerank import get_reranker
+
+    rows = []
+    cwd = os.getcwd()
+    for target_tokens, overlap in itertools.product(args.target_tokens, args.overlap):
+        workdir = tempfile.mkdtemp(prefix="podcast-rag-eval-")
+        os.chdir(workdir)
+        try:
+            _reset_stores()
+            n_chunks = build_index(transcripts, target_tokens, overlap)
+            index_mb = _dir_mb(os.path.join(workdir, "storage"))
+            for k, out_k, rerank in itertools.product(args.k, args.out_k, args.rerank):
+                if out_k > k:
+                    continue
+                r = Retriever(rerank=bool(rerank))
+                scores, lat = [], []
+                for ex in examples:
+                    retrieve._RESULTS.clear()
+                    retrieve._QUERY_VECS.clear()
+                    get_reranker()._scores.clear()
+                    t0 = time.perf_counter()
+                    hits = r.search(ex["question"], k=k, out_k=out_k, filters=ex.get("filters"))
+                    lat.append(time.perf_counter() - t0)
+                    scores.append(score(hits, ex, args.tolerance))
+                row = {"target_tokens": target_tokens, "overlap": overlap, "k": k, "out_k": out_k,
+                       "rerank": bool(rerank)}
+                for m in ("recall", "mrr", "ts_hit", "episode_hit"):
+                    row[m] = round(float(np.mean([s[m] for s in scores])), 4)
+                row["p50_ms"] = round(float(np.percentile(lat, 50)) * 1000, 2)
+                row["p95_ms"] = round(float(np.percentile(lat, 95)) * 1000, 2)
+                row["chunks"] = n_chunks
+                row["index_mb"] = index_mb
+                rows.append(row)
+                print(_fmt(row), flush=True)
+        finally:
+            os.chdir(cwd)
+            _reset_stores()
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def _fmt(row) -> str:
+    return (f"tokens={row['target_tokens']:<4d} overlap={row['overlap']:<4} k={row['k']:<3d} out_k={row['out_k']:<3d} "
+            f"rerank={'on ' if row['rerank'] else 'off'}  recall={row['recall']:.3f} mrr={row['mrr']:.3f} "
+            f"ts_hit={row['ts_hit']:.3f} ep_hit={row['episode_hit']:.3f}  "
+            f"p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms  chunks={row['chunks']} index={row['index_mb']}MB")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Evaluate retrieval quality vs. latency over a settings grid.")
+    ap.add_argument("--dataset", default=os.path.join(ROOT, "eval", "dataset.jsonl"))
+    ap.add_argument("--data-dir", default=os.path.join("storage", "data"), help="episode transcripts (.arrow)")
+    ap.add_argument("--k", type=_ints, default=[5, 10, 15])
+    ap.add_argument("--out-k", type=_ints, default=[3, 6])
+    ap.add_argument("--rerank", type=_ints, default=[0, 1], help="0/1 list")
+    ap.add_argument("--target-tokens", type=_ints, default=[420])
+    ap.add_argument("--overlap", type=_floats, default=[0.2])
+    ap.add_argument("--tolerance", type=float, default=15.0, help="seconds for a timestamp hit")
+    ap.add_argument("--backend", default="numpy", help="index backend for the throwaway indexes")
+    ap.add_argument("--min-recall", type=float, default=None, help="report the cheapest config meeting this recall")
+    ap.add_argument("--out", default=None, help="write all rows as JSON")
+    args = ap.parse_args(argv)
+
+    examples = load_dataset(args.dataset)
+    if not examples:
+        print(f"No labeled examples in {args.dataset}; add lines like "
+              '{"question": "...", "episode_id": "...", "start": 0.0, "end": 30.0}')
+        return 1
+
+    from pipeline.transcript_store import load_episode, EXT
+
+    data_dir = os.path.abspath(args.data_dir)
+    transcripts = []
+    for eid in sorted({ex["episode_id"] for ex in examples}):
+        path = os.path.join(data_dir, eid + EXT)
+        if not os.path.exists(path):
+            path = os.path.join(data_dir, eid + ".json")
+        if not os.path.exists(path):
+            print(f"Skipping examples for {eid}: no transcript in {data_dir}")
+            continue
+        transcripts.append(load_episode(path))
+    known = {tr.episode_id for tr in transcripts}
+    examples = [ex for ex in examples if ex["episode_id"] in known]
+    if not examples:
+        print("None of the labeled episodes have transcripts; index them first.")
+        return 1
+
+    # throwaway indexes, but reuse the real embedding cache across configs and runs
+    os.environ["INDEX_BACKEND"] = args.backend
+    os.environ["METRICS"] = "0"
+    os.environ.setdefault("EMBED_CACHE_PATH", os.path.abspath(os.path.join("storage", "cache", "embeddings.sqlite")))
+
+    print(f"{len(examples)} question(s) over {len(transcripts)} episode(s)")
+    rows = run_grid(examples, transcripts, args)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    if args.min_recall is not None:
+        ok = [r for r in rows if r["recall"] >= args.min_recall]
+        if ok:
+            best = min(ok, key=lambda r: (r["p95_ms"], r["index_mb"]))
+            print(f"\nCheapest config with recall >= {args.min_recall}:\n{_fmt(best)}")
+        else:
+            print(f"\nNo config reaches recall {args.min_recall}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,27 +1,174 @@
 from typing import List, Dict
 
+import numpy as np
+
+from .metrics import span
+
+SENTENCE_END = ('.', '?', '!', '…')
+
+def _speaker_timeline(turns: List[Dict]):
+    """
+    Flatten (possibly overlapping) turns into elementary intervals between consecutive
+    turn boundaries. Returns (bounds, interval_codes, labels); -1 marks a gap.
+    Where turns overlap, the shortest covering turn wins (interjections over the main speaker).
+    """
+    labels, index = [], {}
+    for t in turns:
+        if t["speaker"] not in index:
+            index[t["speaker"]] = len(labels); labels.append(t["speaker"])
+    t_start = np.array([t["start"] for t in turns], dtype=np.float64)
+    t_end = np.array([t["end"] for t in turns], dtype=np.float64)
+    t_code = np.array([index[t["speaker"]] for t in turns], dtype=np.int64)
+
+    bounds = np.unique(np.concatenate([t_start, t_end]))
+    paint = np.full(max(len(bounds) - 1, 0), -1, dtype=np.int64)
+    lo = np.searchsorted(bounds, t_start)
+    hi = np.searchsorted(bounds, t_end)
+    for k in np.argsort(-(t_end - t_start), kind="stable"):
+        paint[lo[k]:hi[k]] = t_code[k]
+    return bounds, paint, labels
+
+def assign_speaker_codes(starts: np.ndarray, turns: List[Dict]):
+    """
+    Vectorized speaker assignment by word start time: returns (codes, labels), codes[i] indexes labels.
+    Words in gaps (or outside all turns) go to the nearest turn; "UNK" only when there are no turns.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    if not turns:
+        return np.zeros(len(starts), dtype=np.int16), ["UNK"]
+    bounds, paint, labels = _speaker_timeline(turns)
+    n_iv = len(paint)
+    if n_iv == 0:
+        # only zero-length turns: everything belongs to the first speaker
+        return np.zeros(len(starts), dtype=np.int16), labels
+    painted = paint >= 0
+
+    # interval whose closed range [b[k], b[k+1]] holds the word; a start exactly on a boundary
+    # belongs to the interval ending there (as the old walk did), unless that one is a gap
+    k = np.searchsorted(bounds, starts, side="left") - 1
+    on_edge = (k + 1 < len(bounds)) & (bounds[np.clip(k + 1, 0, len(bounds) - 1)] == starts)
+    k_next = np.clip(k + 1, 0, n_iv - 1)
+    use_next = on_edge & ((k < 0) | ~painted[np.clip(k, 0, n_iv - 1)]) & (k + 1 < n_iv) & painted[k_next]
+    k = np.where(use_next, k + 1, k)
+
+    inside = (k >= 0) & (k < n_iv)
+    kc = np.clip(k, 0, n_iv - 1)
+    codes = np.where(inside & painted[kc], paint[kc], -1)
+
+    # nearest painted interval on either side for gap words
+    miss = codes < 0
+    if miss.any():
+        ar = np.arange(n_iv)
+        prev_iv = np.maximum.accumulate(np.where(painted, ar, -1))
+        next_iv = np.minimum.accumulate(np.where(painted, ar, n_iv)[::-1])[::-1]
+        km = k[miss]
+        p = np.where(km >= n_iv, prev_iv[-1], np.where(km >= 0, prev_iv[np.clip(km, 0, n_iv - 1)], -1))
+        q = np.where(km < 0, next_iv[0], np.where(km < n_iv, next_iv[np.clip(km, 0, n_iv - 1)], n_iv))
+        s = starts[miss]
+        d_prev = np.where(p >= 0, s - bounds[np.clip(p + 1, 0, len(bounds) - 1)], np.inf)
+        d_next = np.where(q < n_iv, bounds[np.clip(q, 0, len(bounds) - 1)] - s, np.inf)
+        pick = np.where(d_prev <= d_next, p, q)
+        codes[miss] = paint[np.clip(pick, 0, n_iv - 1)]
+    return codes.astype(np.int16), labels
+
 def assign_speakers(words: List[Dict], turns: List[Dict]) -> List[Dict]:
-    j = 0
-    for w in words:
-        while j + 1 < len(turns) and turns[j]["end"] < w["start"]:
-            j += 1
-        speaker = turns[j]["speaker"] if turns and turns[j]["start"] <= w["start"] <= turns[j]["end"] else "UNK"
-        w["speaker"] = speaker
+    with span("assign_speakers") as s:
+        starts = np.fromiter((w["start"] for w in words), dtype=np.float64, count=len(words))
+        codes, labels = assign_speaker_codes(starts, turns)
+        for w, c in zip(words, codes.tolist()):
+            w["speaker"] = labels[c]
+        s.add(words=len(words))
     return words
 
+def _sentence_ends(lengths: np.ndarray, is_end: np.ndarray, max_chars: int) -> np.ndarray:
+    """Exclusive end index of every sentence: at punctuation, or once max_chars is reached."""
+    n = len(lengths)
+    cum = np.concatenate([[0], np.cumsum(lengths + 1)])
+    stops = np.flatnonzero(is_end)
+    if not len(stops) or stops[-1] != n - 1:
+        stops = np.append(stops, n - 1)
+    begins = np.concatenate([[0], stops[:-1] + 1])
+
+    # only runs that reach max_chars before their punctuation need splitting
+    long_runs = np.flatnonzero(cum[stops] - cum[begins] >= max_chars)
+    if not len(long_runs):
+        return stops + 1
+    pieces, prev = [], 0
+    for r in long_runs.tolist():
+        pieces.append(stops[prev:r] + 1)
+        a, stop = int(begins[r]), int(stops[r])
+        split = []
+        while a <= stop:
+            over = int(np.searchsorted(cum, cum[a] + max_chars, side="left")) - 1
+            end = min(stop, max(over, a))
+            split.append(end + 1)
+            a = end + 1
+        pieces.append(np.asarray(split, dtype=np.int64))
+        prev = r + 1
+    pieces.append(stops[prev:] + 1)
+    return np.concatenate(pieces)
+
+def _sentences(starts, ends, texts, codes, labels, lengths, is_end, max_chars):
+    n, n_lab = len(texts), len(labels)
+    if n == 0:
+        return []
+    stops = _sentence_ends(lengths, is_end, max_chars)
+    begins = np.concatenate([[0], stops[:-1]])
+    sid = np.repeat(np.arange(len(stops)), stops - begins)
+
+    # per-sentence speaker seconds, plus first appearance so dict order = order spoken
+    key = sid * n_lab + codes
+    secs = np.bincount(key, weights=ends - starts, minlength=len(stops) * n_lab)
+    first = np.full(len(stops) * n_lab, n, dtype=np.int64)
+    np.minimum.at(first, key, np.arange(n))
+    present = np.flatnonzero(first < n)
+    present = present[np.lexsort((first[present], present // n_lab))]
+
+    speakers = [{} for _ in range(len(stops))]
+    for k, v in zip(present.tolist(), secs[present].tolist()):
+        speakers[k // n_lab][labels[k % n_lab]] = v
+
+    starts_l, ends_l = starts.tolist(), ends.tolist()
+    return [
+        {"text": " ".join(texts[a:b]), "start": starts_l[a], "end": ends_l[b - 1], "speakers": spk}
+        for a, b, spk in zip(begins.tolist(), stops.tolist(), speakers)
+    ]
+
 def sentences_from_words(words: List[Dict], max_chars=280):
-    chunks, cur = [], []
-    cur_len = 0
+    with span("sentences") as s:
+        out = _sentences_from_words(words, max_chars)
+        s.add(words=len(words), sentences=len(out))
+    return out
+
+def _sentences_from_words(words: List[Dict], max_chars):
+    n = len(words)
+    starts = np.fromiter((w["start"] for w in words), dtype=np.float64, count=n)
+    ends = np.fromiter((w["end"] for w in words), dtype=np.float64, count=n)
+    texts = [w["text"] for w in words]
+    labels, index = [], {}
     for w in words:
-        cur.append(w); cur_len += len(w["text"]) + 1
-        if w["text"].endswith(('.', '?', '!', '…')) or cur_len >= max_chars:
-            s_text = " ".join(x["text"] for x in cur)
-            s_start = cur[0]["start"]; s_end = cur[-1]["end"]
-            speakers = {}
-            for x in cur: speakers[x["speaker"]] = speakers.get(x["speaker"], 0) + (x["end"]-x["start"])
-            chunks.append({"text": s_text, "start": s_start, "end": s_end, "speakers": speakers})
-            cur, cur_len = [], 0
-    if cur:
-        s_text = " ".join(x["text"] for x in cur)
-        chunks.append({"text": s_text, "start": cur[0]["start"], "end": cur[-1]["end"], "speakers": {cur[0]['speaker']: cur[-1]['end']-cur[0]['start']}})
-    return chunks
+        if w["speaker"] not in index:
+            index[w["speaker"]] = len(labels); labels.append(w["speaker"])
+    codes = np.fromiter((index[w["speaker"]] for w in words), dtype=np.int64, count=n)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    is_end = np.fromiter((t.endswith(SENTENCE_END) for t in texts), dtype=bool, count=n)
+    return _sentences(starts, ends, texts, codes, labels, lengths, is_end, max_chars)
+
+def sentences_from_transcript(tr, max_chars=280):
+    """sentences_from_words over an EpisodeTranscript's columns (no per-word dicts)."""
+    with span("sentences") as s:
+        out = _sentences_from_transcript(tr, max_chars)
+        s.add(words=len(tr), sentences=len(out))
+    return out
+
+def _sentences_from_transcript(tr, max_chars):
+    import pyarrow.compute as pc
+
+    # older transcripts stored float32; round back to the millisecond timestamps Whisper produced
+    starts = tr.start.astype(np.float64).round(3)
+    ends = tr.end.astype(np.float64).round(3)
+    texts_arr = tr.texts
+    lengths = pc.utf8_length(texts_arr).to_numpy(zero_copy_only=False).astype(np.int64)
+    is_end = pc.match_substring_regex(texts_arr, "[.?!…]$").to_numpy(zero_copy_only=False)
+    codes = tr.speaker_codes.astype(np.int64)
+    return _sentences(starts, ends, texts_arr.to_pylist(), codes, tr.speaker_labels, lengths, is_end, max_chars)
@@ -0,0 +1,207 @@
+# pipeline/batch.py
+"""
+Batch ingestion: convert/transcribe/diarize/chunk many episodes in parallel,
+then embed + write them to the index through a single serialized writer.
+
+CLI:
+    python -m pipeline.batch storage/data/*.mp3 --workers 4
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+AUDIO_EXTS = (".mp3", ".wav", ".m4a")
+
+
+def default_workers() -> int:
+    """One worker per Whisper thread budget (CTranslate2 uses 4 threads unless told otherwise)."""
+    threads = int(os.getenv("WHISPER_CPU_THREADS", "0")) or 4
+    return max(1, (os.cpu_count() or 1) // threads)
+
+
+def prepare_episode(file_path, title: str, on_stage=None) -> dict:
+    """
+    CPU-heavy stages for one file: convert -> transcribe -> diarize -> align.
+    Runs inside a pool worker; returns a picklable dict ready for the index writer,
+    which windows the sentences as it embeds them. `on_stage(name)` is called as
+    "transcribe" and "chunk" begin.
+    """
+    from .ingest import process_episode, transcript_fingerprint
+    from .transcript_store import load_episode
+    from .align import sentences_from_transcript
+    from .localize import write_sentence_index
+
+    if on_stage:
+        on_stage("transcribe")
+    ep_path, ep_id = process_episode(Path(file_path), title)
+    if on_stage:
+        on_stage("chunk")
+    tr = load_episode(ep_path)
+
+    sents = sentences_from_transcript(tr)
+    write_sentence_index(tr.episode_id, sents)
+    return {
+        "episode_id": tr.episode_id,
+        "episode_title": tr.episode_title,
+        "path": str(ep_path),
+        "fingerprint": transcript_fingerprint(),
+        "sentences": sents,
+    }
+
+
+def write_episode(prepared: dict):
+    """
+    Windowing + embedding + index write for one prepared episode (always called from the
+    writer thread). Windows stream into the embedder; the chunk list is never built.
+    """
+    from .embed_index import upsert_episode
+    from .chunk import iter_windows, default_token_counter
+
+    meta = {
+        "episode_id": prepared["episode_id"],
+        "episode_title": prepared["episode_title"],
+        "fingerprint": prepared.get("fingerprint", ""),
+    }
+    # replace=True ensures re-indexing the SAME episode_id overwrites only its own chunks
+    upsert_episode(iter_windows(prepared["sentences"], token_counter=default_token_counter()), meta, replace=True)
+
+
+def _make_executor(workers: int, use_processes: bool):
+    if use_processes:
+        # spawn: forking a process that already holds torch/CT2 threads can deadlock
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def ingest_many(items, workers: int | None = None, use_processes: bool = True, progress=None) -> list[dict]:
+    """
+    Ingest many (file_path, title) pairs.
+
+    Preparation runs on a bounded pool; embedding + index writes run one at a time
+    on a writer thread. `progress(event)` is called from the calling thread with
+    {"item", "file", "title", "stage", "status", "error", "done", "total"} (item = input position).
+    Returns one result dict per input, in input order.
+    """
+    items = [(str(p), t) for p, t in items]
+    total = len(items)
+    results = [{"file": p, "title": t, "status": "queued", "episode_id": None, "error": None} for p, t in items]
+    if not items:
+        return results
+
+    events = queue.Queue()
+    to_write = queue.Queue()
+    done = 0
+
+    def emit(i, stage, status, error=None):
+        events.put((i, stage, status, error))
+
+    def writer():
+        while True:
+            job = to_write.get()
+            if job is None:
+                return
+            i, prepared = job
+            emit(i, "index", "running")
+            try:
+                write_episode(prepared)
+                emit(i, "index", "ok")
+            except Exception as e:
+                emit(i, "index", "failed", f"{type(e).__name__}: {e}")
+
+    def drain():
+        nonlocal done
+        while True:
+            try:
+                i, stage, status, error = events.get_nowait()
+            except queue.Empty:
+                return
+            r = results[i]
+            r["stage"], r["status"] = stage, status
+            if error:
+                r["error"] = error
+            if status in ("ok", "failed") and (stage == "index" or status == "failed"):
+                done += 1
+            if progress:
+                progress({"item": i, "file": r["file"], "title": r["title"], "stage": stage, "status": status,
+                          "error": error, "done": done, "total": total})
+
+    wt = threading.Thread(target=writer, name="ingest-writer", daemon=True)
+    wt.start()
+
+    workers = max(1, min(workers or default_workers(), total))
+    with _make_executor(workers, use_processes) as ex:
+        pending = {}
+        for i, (path, title) in enumerate(items):
+            pending[ex.submit(prepare_episode, path, title)] = i
+            emit(i, "prepare", "running")
+        while pending:
+            finished, _ = wait(list(pending), timeout=0.2, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                i = pending.pop(fut)
+                try:
+                    prepared = fut.result()
+                except Exception as e:
+                    emit(i, "prepare", "failed", f"{type(e).__name__}: {e}")
+                    continue
+                results[i]["episode_id"] = prepared["episode_id"]
+                emit(i, "prepare", "ok")
+                to_write.put((i, prepared))
+            drain()
+
+    to_write.put(None)
+    while wt.is_alive():
+        wt.join(timeout=0.2)
+        drain()
+    drain()
+    return results
+
+
+def _expand(paths):
+    for p in map(Path, paths):
+        if p.is_dir():
+            yield from sorted(x for x in p.iterdir() if x.suffix.lower() in AUDIO_EXTS)
+        else:
+            yield p
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Transcribe and index many podcast episodes.")
+    ap.add_argument("paths", nargs="+", help="audio files or directories")
+    ap.add_argument("--workers", type=int, default=None, help="parallel episodes (default: cores / whisper threads)")
+    ap.add_argument("--threads", action="store_true", help="use a thread pool instead of processes")
+    args = ap.parse_args(argv)
+
+    from .worker import writer_lease
+
+    items = [(p, p.stem) for p in _expand(args.paths)]
+    t0 = time.perf_counter()
+
+    def report(ev):
+        line = f"[{ev['done']}/{ev['total']}] {ev['title']}: {ev['stage']} {ev['status']}"
+        if ev.get("error"):
+            line += f" ({ev['error']})"
+        print(line, flush=True)
+
+    # the app's worker writes the same store; only one writer at a time
+    with writer_lease() as ok:
+        if not ok:
+            print("A worker is writing to this storage directory; queue the files from the app instead,"
+                  " or run this once it has exited.")
+            return 1
+        results = ingest_many(items, workers=args.workers, use_processes=not args.threads, progress=report)
+    failed = [r for r in results if r["status"] != "ok"]
+    print(f"Indexed {len(results) - len(failed)}/{len(results)} episode(s) in {time.perf_counter() - t0:.1f}s")
+    from .embed_cache import get_embedding_cache
+    cache = get_embedding_cache()
+    if cache is not None:
+        print(f"Embedding cache: {cache.stats()}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
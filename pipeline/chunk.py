@@ -1,22 +1,162 @@
-def time_aware_windows(sentences, target_tokens=420, overlap=0.2):
-    def est_tokens(t): return max(1, int(len(t.split()) * 1.3))
-    windows = []
+import os
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+
+from .metrics import span
+
+def est_tokens(t): return max(1, int(len(t.split()) * 1.3))
+
+def make_token_counter(tokenizer=None, cache_size=1 << 16):
+    """
+    text -> token count, memoized per sentence text.
+    `tokenizer` is a Hugging Face tokenizer (e.g. the MiniLM one); None keeps the word estimate.
+    """
+    if tokenizer is None:
+        count = est_tokens
+    else:
+        def count(t):
+            return max(1, len(tokenizer(t, add_special_tokens=False)["input_ids"]))
+    return lru_cache(maxsize=cache_size)(count)
+
+_COUNTERS = {}
+
+def default_token_counter():
+    """Counter selected by CHUNK_TOKENIZER: "estimate" (default) or a HF model name / "minilm"."""
+    name = os.getenv("CHUNK_TOKENIZER", "estimate")
+    if name not in _COUNTERS:
+        if name == "estimate":
+            _COUNTERS[name] = make_token_counter()
+        else:
+            # reuse the embedding service's tokenizer so chunk sizes match what the embedder sees
+            from .embedder import DEFAULT_MODEL, get_embedding_service
+            model = DEFAULT_MODEL if name == "minilm" else name
+            _COUNTERS[name] = make_token_counter(get_embedding_service(model).tokenizer)
+    return _COUNTERS[name]
+
+def prefix_sum_windows(sentences, target_tokens=420, overlap=0.2, token_counter=None) -> list:
+    """
+    All windows of an episode from prefix sums (batch form, for callers that want the list;
+    it needs the whole sentence list and holds O(sentences x speakers) arrays while planning,
+    iter_windows is the streaming one). Token counts are computed
+    once per sentence; window ends come from a binary search over their prefix sum, text is
+    sliced out of one shared buffer, and speaker seconds are differences of per-speaker prefix sums.
+    """
+    n = len(sentences)
+    if n == 0:
+        return []
+    count = token_counter or est_tokens
+    texts = [s["text"] for s in sentences]
+    tok = np.fromiter((count(t) for t in texts), dtype=np.int64, count=n)
+    tok_cum = np.concatenate([[0], np.cumsum(tok)])
+
+    buf = " ".join(texts)
+    off = np.concatenate([[0], np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=n) + 1)]).tolist()
+
+    spk = [s["speakers"] for s in sentences]
+    per = np.fromiter(map(len, spk), dtype=np.int64, count=n)
+    keys = [k for d in spk for k in d]
+    vals = [v for d in spk for v in d.values()]
+    labels = list(dict.fromkeys(keys))
+    index = {k: c for c, k in enumerate(labels)}
+    rows = np.repeat(np.arange(n), per)
+    cols = np.fromiter(map(index.__getitem__, keys), dtype=np.int64, count=len(keys))
+    pos = np.arange(len(keys)) - np.repeat(np.cumsum(per) - per, per)
+    n_lab = len(labels)
+    secs = np.zeros((n + 1, n_lab))
+    seen = np.zeros((n + 1, n_lab), dtype=np.int64)
+    secs[rows + 1, cols] = vals
+    seen[rows + 1, cols] = 1
+    np.cumsum(secs, axis=0, out=secs)
+    np.cumsum(seen, axis=0, out=seen)
+    # rank of each speaker's first mention at/after sentence i, so merged dicts keep the old key order
+    first = np.full((n + 1, n_lab), (n + 1) * (n_lab + 1), dtype=np.int64)
+    first[rows, cols] = rows * (n_lab + 1) + pos
+    next_seen = np.minimum.accumulate(first[::-1], axis=0)[::-1]
+
+    # every window end in one pass: first j with tokens(i..j) >= target
+    ends = np.searchsorted(tok_cum, tok_cum[:-1] + target_tokens, side="left")
+    ends = np.minimum(np.maximum(ends, np.arange(1, n + 1)), n).tolist()
+    starts, stops = [], []
     i = 0
-    while i < len(sentences):
-        cur, cur_tok = [], 0
-        start_t = sentences[i]["start"]
-        j = i
-        while j < len(sentences) and cur_tok < target_tokens:
-            cur.append(sentences[j])
-            cur_tok += est_tokens(sentences[j]["text"])
-            j += 1
-        end_t = cur[-1]["end"]
-        text = " ".join(s["text"] for s in cur)
+    while i < n:
+        j = ends[i]
+        starts.append(i); stops.append(j)
+        i += max(1, int((j - i) * (1 - overlap)))
+
+    a, b = np.asarray(starts), np.asarray(stops)
+    w_secs = (secs[b] - secs[a]).tolist()
+    w_seen = (seen[b] - seen[a]).tolist()
+    w_first = next_seen[a].tolist()
+    w_tok = (tok_cum[b] - tok_cum[a]).tolist()
+    out = []
+    for w, (i, j) in enumerate(zip(starts, stops)):
+        present = sorted((f, c) for c, (cnt, f) in enumerate(zip(w_seen[w], w_first[w])) if cnt)
+        out.append({
+            "text": buf[off[i]:off[j] - 1],
+            "start": sentences[i]["start"],
+            "end": sentences[j - 1]["end"],
+            "speakers": {labels[c]: w_secs[w][c] for _, c in present},
+            "tokens": w_tok[w],
+        })
+    return out
+
+def iter_windows(sentences, target_tokens=420, overlap=0.2, token_counter=None):
+    """
+    Streaming form of prefix_sum_windows (same windows, same order): a two-pointer pass
+    over any sentence iterable that only buffers the current window's sentences, with
+    rolling token and per-speaker sums, so windows can flow straight into embedding.
+    """
+    count = token_counter or est_tokens
+    it = iter(sentences)
+    buf = deque()  # (sentence, tokens) for sentences i..j-1
+    tokens = 0
+    secs, seen = {}, {}  # rolling per-speaker seconds / sentence counts over the window
+
+    def pull():
+        nonlocal tokens
+        s = next(it, None)
+        if s is None:
+            return False
+        t = count(s["text"])
+        buf.append((s, t))
+        tokens += t
+        for k, v in s["speakers"].items():
+            secs[k] = secs.get(k, 0.0) + v
+            seen[k] = seen.get(k, 0) + 1
+        return True
+
+    while buf or pull():
+        # window end: first sentence at which the window reaches target_tokens (or the last one)
+        while tokens < target_tokens and pull():
+            pass
         speakers = {}
-        for s in cur:
+        for s, _ in buf:
+            for k in s["speakers"]:
+                if k not in speakers:
+                    speakers[k] = secs[k]
+            if len(speakers) == len(seen):
+                break
+        yield {
+            "text": " ".join(s["text"] for s, _ in buf),
+            "start": buf[0][0]["start"],
+            "end": buf[-1][0]["end"],
+            "speakers": speakers,
+            "tokens": tokens,
+        }
+        for _ in range(max(1, int(len(buf) * (1 - overlap)))):
+            s, t = buf.popleft()
+            tokens -= t
             for k, v in s["speakers"].items():
-                speakers[k] = speakers.get(k, 0) + v
-        windows.append({"text": text, "start": start_t, "end": end_t, "speakers": speakers, "tokens": cur_tok})
-        step = max(1, int(len(cur) * (1 - overlap)))
-        i += step
-    return windows
+                seen[k] -= 1
+                if seen[k]:
+                    secs[k] -= v
+                else:
+                    del seen[k], secs[k]
+
+def time_aware_windows(sentences, target_tokens=420, overlap=0.2, token_counter=None):
+    with span("chunk") as s:
+        out = prefix_sum_windows(sentences, target_tokens, overlap, token_counter)
+        s.add(sentences=len(sentences), chunks=len(out))
+    return out
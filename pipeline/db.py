@@ -0,0 +1,21 @@
+# pipeline/db.py
+"""Small SQLite helpers shared by the local stores (caches, catalog, queues)."""
+import os
+
+# Same modern-sqlite shim as the Chroma modules
+try:
+    import sys, pysqlite3
+    sys.modules["sqlite3"] = pysqlite3
+except Exception:
+    pass
+
+import sqlite3
+
+
+def connect(path) -> sqlite3.Connection:
+    """WAL-mode connection usable from several threads (callers serialize writes with their own lock)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
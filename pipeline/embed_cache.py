@@ -0,0 +1,150 @@
+# pipeline/embed_cache.py
+"""
+Persistent embedding cache keyed by (model variant, chunk-text hash); the variant
+includes the backend (torch / torch-int8 / onnx / onnx-int8 file), so quantized
+and full-precision vectors never stand in for each other.
+
+Vectors are stored as float16 blobs in SQLite and evicted least-recently-used
+once the table grows past `max_entries`. Re-indexing an episode, or re-chunking
+with slightly different parameters, only pays for text that was never embedded.
+"""
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+from .db import connect
+
+CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "storage/cache/embeddings.sqlite")
+_SQL_VARS = 500  # stay well below SQLite's bound-parameter limit
+_EVICT_EVERY = 1000  # rows written between size checks; the table may overshoot by this much
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = CACHE_PATH, max_entries: int | None = None):
+        self.max_entries = int(max_entries or os.getenv("EMBED_CACHE_MAX", "200000"))
+        self._conn = connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " model TEXT NOT NULL, key BLOB NOT NULL, vec BLOB NOT NULL, used INTEGER NOT NULL,"
+            " PRIMARY KEY (model, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS vectors_used ON vectors(used)")
+        row = self._conn.execute("SELECT COALESCE(MAX(used), 0) FROM vectors").fetchone()
+        self._clock = int(row[0])
+        self.hits = 0
+        self.misses = 0
+        self._unchecked = _EVICT_EVERY  # check the size on the first write
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get_many(self, model: str, keys: list) -> dict:
+        """{key: float32 vector} for the keys that are cached; bumps their recency."""
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_VARS):
+                part = keys[i:i + _SQL_VARS]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM vectors WHERE model = ? AND key IN ({marks})", [model, *part]
+                ).fetchall()
+                for k, v in rows:
+                    found[bytes(k)] = np.frombuffer(v, dtype=np.float16).astype(np.float32)
+            if found:
+                now = self._tick()
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany(
+                        "UPDATE vectors SET used = ? WHERE model = ? AND key = ?",
+                        [(now, model, k) for k in found],
+                    )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, model: str, items):
+        """items: iterable of (key, vector)."""
+        with self._lock:
+            now = self._tick()
+            rows = [(model, k, np.asarray(v, dtype=np.float16).tobytes(), now) for k, v in items]
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (model, key, vec, used) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._unchecked += len(rows)
+            if self._unchecked >= _EVICT_EVERY:
+                self._evict()
+
+    def _evict(self):
+        """Trim to max_entries; COUNT(*) scans the table, so put_many only calls this every _EVICT_EVERY rows."""
+        self._unchecked = 0
+        n = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        extra = n - self.max_entries
+        if extra > 0:
+            self._conn.execute(
+                "DELETE FROM vectors WHERE (model, key) IN (SELECT model, key FROM vectors ORDER BY used LIMIT ?)",
+                (extra,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": n,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Process-wide cache, or None when EMBED_CACHE=0."""
+    global _CACHE
+    if os.getenv("EMBED_CACHE", "1") == "0":
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = EmbeddingCache()
+    return _CACHE
+
+
+def encode_cached(texts, service=None, cache=None) -> np.ndarray:
+    """EmbeddingService.encode, but texts already embedded by the same model variant come from the cache."""
+    from .embedder import get_embedding_service
+
+    service = service or get_embedding_service()
+    cache = cache if cache is not None else get_embedding_cache()
+    texts = [str(t) for t in texts]
+    if cache is None or not texts:
+        return service.encode(texts)
+
+    keys = [text_key(t) for t in texts]
+    found = cache.get_many(service.variant, keys)
+    todo = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in todo:
+            todo[k] = t
+    if todo:
+        # round through float16 like stored entries, so vectors don't depend on cache state
+        fresh = service.encode(list(todo.values())).astype(np.float16).astype(np.float32)
+        new = dict(zip(todo.keys(), fresh))
+        cache.put_many(service.variant, new.items())
+        found.update(new)
+    return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
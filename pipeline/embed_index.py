@@ -1,6 +1,6 @@
 # pipeline/embed_index.py
 
-import os, json
+import os, json, threading
 
 # Be quiet by default
 os.environ.setdefault("CHROMA_TELEMETRY", "0")
@@ -14,48 +14,421 @@ try:
 except Exception:
     pass
 
-_EMBEDDER = None
+from .embed_cache import encode_cached
+from .lexical import get_lexical_index
+from .filters import speaker_key, SPEAKER_PREFIX
+from .db import connect
+from .metrics import span
+
+INDEX_META_PATH = "storage/index_meta.sqlite"
+CHROMA_PATH = os.getenv("CHROMA_PATH", "storage/chroma")
+WRITE_BATCH_ROWS = int(os.getenv("WRITE_BATCH_ROWS", "5000"))
+HIDDEN = -1  # catalog version of an episode being deleted
+EMBED_ROWS = 256  # chunk texts embedded per step while chunks stream in
+
 _COLL = None
+_CLIENT = None
+_RETIRED = None  # Chroma system replaced by the last reopen; stopped on the next one
+_SEEN = None  # index version the open Chroma client is known to reflect
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+_CATALOG = (None, [], {})  # (index version, rows, live versions)
+_META = None
+_META_LOCK = threading.Lock()
 
-def get_chroma():
+def get_chroma(reopen: bool = False):
     # Import here (lazy) so our env is set before Chroma loads
     import chromadb
     from chromadb.config import Settings
 
-    global _COLL
+    global _COLL, _CLIENT, _RETIRED
+    if _COLL is not None and reopen:
+        # a PersistentClient keeps its vector segments in memory and never sees writes
+        # made by another process (the ingest worker); build a fresh system for the path.
+        # The old one may still serve an in-flight query, so it is stopped one reopen later.
+        if _RETIRED is not None:
+            _RETIRED.stop()
+        _RETIRED = _CLIENT._system
+        _CLIENT.clear_system_cache()
+        _COLL = None
     if _COLL is None:
-        client = chromadb.PersistentClient(
-            path="storage/chroma",
+        _CLIENT = chromadb.PersistentClient(
+            path=CHROMA_PATH,
             settings=Settings(anonymized_telemetry=False),
         )
-        _COLL = client.get_or_create_collection(
+        _COLL = _CLIENT.get_or_create_collection(
             name="podcast_chunks",
             metadata={"hnsw:space": "cosine"},
         )
     return _COLL
 
-def _get_embedder(model_name="sentence-transformers/all-MiniLM-L6-v2"):
-    global _EMBEDDER
-    if _EMBEDDER is None:
-        from sentence_transformers import SentenceTransformer
-        _EMBEDDER = SentenceTransformer(model_name)
-    return _EMBEDDER
+def get_index():
+    """
+    Vector store selected by INDEX_BACKEND: "chroma" (default) or "numpy".
+    Both expose the Chroma collection calls used here and in the retriever:
+    upsert / delete / query / get / count. Call it per operation rather than
+    holding the handle: the Chroma one is replaced after another process writes.
+    """
+    global _INDEX, _SEEN
+    with _INDEX_LOCK:
+        if _INDEX is not None and _INDEX is _COLL:
+            version = index_version()
+            if version != _SEEN:
+                _INDEX = get_chroma(reopen=_SEEN is not None)
+                _SEEN = version
+        if _INDEX is None:
+            backend = os.getenv("INDEX_BACKEND", "chroma").lower()
+            if backend == "chroma":
+                _SEEN = index_version()
+                _INDEX = get_chroma()
+            elif backend == "numpy":
+                from .numpy_index import NumpyIndex
+                _INDEX = NumpyIndex()
+            else:
+                raise ValueError(f"Unknown index backend: {backend}")
+    return _INDEX
+
+def _meta_conn():
+    global _META
+    if _META is None:
+        _META = connect(INDEX_META_PATH)
+        _META.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS episodes ("
+            " episode_id TEXT PRIMARY KEY, title TEXT NOT NULL, chunk_count INTEGER NOT NULL,"
+            " duration REAL NOT NULL, speakers TEXT NOT NULL, fingerprint TEXT NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 0);"
+        )
+        if "version" not in {r[1] for r in _META.execute("PRAGMA table_info(episodes)")}:
+            # catalogs from before versioned writes: their chunks are unversioned (= version 0)
+            _META.execute("ALTER TABLE episodes ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    return _META
+
+def index_version() -> int:
+    """Monotonic counter bumped on every index write (shared across processes)."""
+    with _META_LOCK:
+        row = _meta_conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    return int(row[0]) if row else 0
+
+def _bump(conn, key="version"):
+    global _SEEN
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, 1)"
+        " ON CONFLICT(key) DO UPDATE SET value = value + 1", (key,)
+    )
+    if key == "version":
+        value = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        # our own write: the open client already holds it, unless another process wrote in between
+        if _SEEN is not None and value == _SEEN + 1:
+            _SEEN = value
+
+def bump_index_version() -> int:
+    with _META_LOCK:
+        _bump(_meta_conn())
+    return index_version()
+
+def _next_chunk_version() -> int:
+    """Fresh version for a staged episode (unique across episodes and processes)."""
+    with _META_LOCK:
+        conn = _meta_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _bump(conn, "chunk_seq")
+            value = conn.execute("SELECT value FROM meta WHERE key = 'chunk_seq'").fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return int(value)
+
+def _write_catalog(delete=(), rows=(), wipe=False, hide=(), hide_all=False):
+    """
+    Catalog change + version bump in one transaction, so readers never see one without the other.
+    Writing an episode's row is what makes its staged chunk version visible; `hide` marks
+    episodes HIDDEN (nothing visible) while their chunks are being deleted.
+    """
+    with _META_LOCK:
+        conn = _meta_conn()
+        conn.execute("BEGIN")
+        try:
+            if wipe:
+                conn.execute("DELETE FROM episodes")
+            if hide_all:
+                conn.execute("UPDATE episodes SET version = ?", (HIDDEN,))
+            conn.executemany("UPDATE episodes SET version = ? WHERE episode_id = ?",
+                             [(HIDDEN, str(e)) for e in hide])
+            conn.executemany("DELETE FROM episodes WHERE episode_id = ?", [(str(e),) for e in delete])
+            conn.executemany(
+                "INSERT OR REPLACE INTO episodes"
+                " (episode_id, title, chunk_count, duration, speakers, fingerprint, version)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", rows,
+            )
+            _bump(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def _catalog_row(episode_id, title, metas, fingerprint="", version=0):
+    speakers = {}
+    for m in metas:
+        for label in json.loads(m.get("speakers_json") or "{}"):
+            speakers.setdefault(label, None)
+    duration = max((float(m.get("end_time", 0.0)) for m in metas), default=0.0)
+    return (str(episode_id), str(title), len(metas), duration, json.dumps(list(speakers)),
+            str(fingerprint or ""), int(version))
+
+def _catalog_rows():
+    with _META_LOCK:
+        return _meta_conn().execute(
+            "SELECT episode_id, title, chunk_count, duration, speakers, fingerprint, version FROM episodes"
+            " ORDER BY title COLLATE NOCASE, episode_id"
+        ).fetchall()
+
+def _catalog():
+    """(rows, live versions) for the current index version."""
+    global _CATALOG
+    version = index_version()
+    if _CATALOG[0] == version:
+        return _CATALOG[1], _CATALOG[2]
+    got = _catalog_rows()
+    if not got and int(get_index().count()) > 0:
+        # index built before the catalog existed; rebuild once and take whatever it found
+        # (it may legitimately find nothing, e.g. only a half-written first ingest)
+        rebuild_catalog()
+        version = index_version()
+        got = _catalog_rows()
+    rows = [
+        {"episode_id": e, "title": t, "chunk_count": int(n), "duration": float(d),
+         "speakers": json.loads(spk), "fingerprint": fp, "version": int(v)}
+        for e, t, n, d, spk, fp, v in got if v != HIDDEN
+    ]
+    live = {e: int(v) for e, _, _, _, _, _, v in got}
+    _CATALOG = (version, rows, live)
+    return rows, live
+
+def list_episodes() -> list:
+    """
+    One dict per indexed episode (episode_id, title, chunk_count, duration, speakers,
+    fingerprint, version), sorted by title. Cached per index version, so callers can use it on every rerun.
+    """
+    return _catalog()[0]
+
+def live_versions() -> dict:
+    """episode_id -> chunk version searches may return (HIDDEN while the episode is being deleted)."""
+    return _catalog()[1]
+
+def is_live(meta, live) -> bool:
+    """
+    True if a chunk belongs to its episode's visible version. Staged (not yet swapped)
+    and superseded chunks are not; unversioned chunks count as version 0.
+    """
+    v = live.get((meta or {}).get("episode_id"))
+    if v is None:
+        return "version" not in (meta or {})
+    return int(meta.get("version", 0)) == v
+
+def rebuild_catalog(page: int = 1000):
+    """
+    Recompute the catalog from chunk metadata (one paged pass over the index). Each
+    episode gets its newest complete version; a staged version whose write was cut
+    short has fewer chunks than its n_chunks and is skipped (its chunks stay invisible).
+    """
+    coll = get_index()
+    by_episode = {}
+    total = int(coll.count())
+    for offset in range(0, total, page):
+        got = coll.get(include=["metadatas"], limit=page, offset=offset)
+        for m in got.get("metadatas") or []:
+            if m and m.get("episode_id"):
+                by_episode.setdefault(m["episode_id"], []).append(m)
+    rows = []
+    for eid, metas in by_episode.items():
+        versions = {}
+        for m in metas:
+            versions.setdefault(int(m.get("version", 0)), []).append(m)
+        # chunks written before n_chunks existed carry none; treat them as complete
+        complete = [v for v, ms in versions.items() if len(ms) >= max(int(m.get("n_chunks", 0)) for m in ms)]
+        if not complete:
+            continue
+        version = max(complete)
+        metas = versions[version]
+        rows.append(_catalog_row(eid, metas[0].get("episode_title", ""), metas, version=version))
+    _write_catalog(rows=rows, wipe=True)
+
+def backfill_speaker_keys(page: int = 1000) -> int:
+    """
+    Add spk_<label> keys (and lexical speaker rows) to chunks indexed before speaker
+    filters existed, so those filters don't silently skip them. Runs once per store
+    (a flag in the meta table); returns how many chunks were updated.
+    """
+    with _META_LOCK:
+        if _meta_conn().execute("SELECT 1 FROM meta WHERE key = 'speaker_keys'").fetchone():
+            return 0
+    with _WRITER.lock:
+        coll = get_index()
+        todo = []
+        total = int(coll.count())
+        # collect first: updating while paging would shift the offsets of some stores
+        for offset in range(0, total, page):
+            got = coll.get(include=["documents", "metadatas"], limit=page, offset=offset)
+            for cid, doc, m in zip(got["ids"], got.get("documents") or [], got.get("metadatas") or []):
+                speakers = json.loads((m or {}).get("speakers_json") or "{}")
+                if speakers and not any(k.startswith(SPEAKER_PREFIX) for k in m):
+                    todo.append((cid, doc, m, speakers))
+        for i in range(0, len(todo), WRITE_BATCH_ROWS):
+            part = todo[i:i + WRITE_BATCH_ROWS]
+            coll.update(ids=[cid for cid, _, _, _ in part],
+                        metadatas=[{**m, **{speaker_key(l): float(v) for l, v in spk.items()}}
+                                   for _, _, m, spk in part])
+        if todo:
+            get_lexical_index().add([t[0] for t in todo], [t[1] for t in todo],
+                                    [t[2]["episode_id"] for t in todo], [t[3] for t in todo])
+        with _META_LOCK:
+            conn = _meta_conn()
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('speaker_keys', 1)")
+            if todo:
+                _bump(conn)  # cached results from before the backfill are stale
+    return len(todo)
+
+def _delete_ids(coll, ids):
+    for i in range(0, len(ids), WRITE_BATCH_ROWS):
+        coll.delete(ids=ids[i:i + WRITE_BATCH_ROWS])
+    get_lexical_index().delete(ids)
+
+def _collect_garbage(live: dict):
+    """Delete chunks older than each episode's (just swapped-in) version; newer staged ones stay."""
+    if not live:
+        return
+    coll = get_index()
+    # one lookup for every episode in the flush
+    got = coll.get(where={"episode_id": {"$in": [str(e) for e in live]}}, include=["metadatas"])
+    stale = [cid for cid, m in zip(got["ids"], got.get("metadatas") or [])
+             if int((m or {}).get("version", 0)) < live.get((m or {}).get("episode_id"), 0)]
+    if stale:
+        _delete_ids(coll, stale)
+
+
+def _merge_into_live(coll, item):
+    """
+    replace=False writes add to the live version: n_chunks and the catalog row must count
+    the chunks already there (that this write doesn't overwrite), not just the incoming ones.
+    """
+    row = item["row"]
+    eid, version = row[0], row[-1]
+    got = coll.get(where={"episode_id": eid}, include=["metadatas"])
+    incoming = set(item["ids"])
+    kept = [m for cid, m in zip(got["ids"], got.get("metadatas") or [])
+            if cid not in incoming and is_live(m, {eid: version})]
+    for m in item["metas"]:
+        m["n_chunks"] = len(kept) + len(item["ids"])
+    item["row"] = _catalog_row(eid, row[1], kept + item["metas"], row[5], version)
+
+
+class _WriteBatcher:
+    """
+    Group commit for episode writes. Callers queue staged episodes (chunks already
+    embedded); whichever caller takes the flush lock writes everything queued so far
+    in one pass: WRITE_BATCH_ROWS-sized (or the smallest requested batch_size)
+    vector-store upserts, one lexical transaction,
+    one catalog transaction that swaps every episode to its new version, then GC.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # held while flushing (and by delete / wipe)
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def submit(self, item: dict):
+        item["done"], item["error"] = threading.Event(), None
+        with self._pending_lock:
+            self._pending.append(item)
+        with self.lock:
+            if not item["done"].is_set():
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                try:
+                    self._flush(batch)
+                except BaseException as e:
+                    for it in batch:
+                        it["error"] = e
+                finally:
+                    for it in batch:
+                        it["done"].set()
+        if item["error"] is not None:
+            raise item["error"]
+
+    def _flush(self, batch):
+        coll = get_index()
+        for it in batch:
+            if not it["replace"]:
+                _merge_into_live(coll, it)
+        ids = [cid for it in batch for cid in it["ids"]]
+        docs = [d for it in batch for d in it["docs"]]
+        metas = [m for it in batch for m in it["metas"]]
+        embeddings = [e for it in batch for e in it["embeddings"]]
+        step = min([WRITE_BATCH_ROWS] + [it["batch_size"] for it in batch if it.get("batch_size")])
+        for i in range(0, len(ids), step):
+            j = i + step
+            coll.upsert(ids=ids[i:j], documents=docs[i:j], metadatas=metas[i:j], embeddings=embeddings[i:j])
+        # keep the BM25 index in step with the vector store
+        get_lexical_index().add(ids, docs, [m["episode_id"] for m in metas],
+                                [json.loads(m["speakers_json"]) for m in metas])
+
+        # the same episode queued twice: the newest version wins
+        rows = {}
+        for it in batch:
+            row = it["row"]
+            if row[0] not in rows or row[-1] >= rows[row[0]][-1]:
+                rows[row[0]] = row
+        _write_catalog(rows=list(rows.values()))
+        _collect_garbage({eid: row[-1] for eid, row in rows.items()
+                          if any(it["replace"] and it["row"][0] == eid for it in batch)})
+
+
+_WRITER = _WriteBatcher()
+
+def wipe_index():
+    """Delete every chunk from the vector store and the lexical index (hidden from searches first)."""
+    with _WRITER.lock:
+        _write_catalog(hide_all=True)
+        coll = get_index()
+        # Chroma refuses an empty where; delete by id, one page at a time
+        while True:
+            ids = coll.get(include=[], limit=WRITE_BATCH_ROWS)["ids"]
+            if not ids:
+                break
+            coll.delete(ids=ids)
+        get_lexical_index().wipe()
+        _write_catalog(wipe=True)
 
 def delete_episode(episode_id):
-    coll = get_chroma()
-    try:
-        coll.delete(where={"episode_id": str(episode_id)})
-    except Exception:
-        pass
+    with _WRITER.lock:
+        _write_catalog(hide=[episode_id])
+        coll = get_index()
+        ids = coll.get(where={"episode_id": str(episode_id)}, include=[])["ids"]
+        if ids:
+            _delete_ids(coll, ids)
+        _write_catalog(delete=[episode_id])
 
-def upsert_episode(chunks, episode_meta, batch_size=200, replace=True):
-    if replace and episode_meta.get("episode_id"):
-        delete_episode(episode_meta["episode_id"])
+def upsert_episode(chunks, episode_meta, batch_size=None, replace=True):
+    """
+    Stage the episode's chunks under a new version and swap it in atomically; searches
+    keep seeing the previous version until then. replace=False writes into the live version.
+    `chunks` may be any iterable (e.g. chunk.iter_windows); it is embedded EMBED_ROWS at a time
+    as it is consumed. batch_size caps rows per vector-store upsert (default WRITE_BATCH_ROWS).
+    """
+    with span("upsert_episode") as s:
+        s.add(chunks=_upsert_episode(chunks, episode_meta, batch_size, replace))
 
-    coll = get_chroma()
-    emb = _get_embedder()
+def _upsert_episode(chunks, episode_meta, batch_size, replace) -> int:
+    episode_id = str(episode_meta.get("episode_id", ""))
+    live = live_versions().get(episode_id)
+    version = live if not replace and live not in (None, HIDDEN) else _next_chunk_version()
 
-    ids, docs, metas = [], [], []
+    # unchanged chunk texts (re-index, title edits, re-chunk experiments) come from the cache;
+    # embedding happens outside the write lock, so concurrent writers only queue for the flush
+    ids, docs, metas, embeddings = [], [], [], []
     for idx, ch in enumerate(chunks):
         speakers = ch.get("speakers") or {}
         if isinstance(speakers, dict):
@@ -66,11 +439,12 @@ def upsert_episode(chunks, episode_meta, batch_size=200, replace=True):
         top = max(speakers, key=speakers.get) if speakers else ""
         top_secs = float(speakers[top]) if top else 0.0
 
-        ids.append(f"{episode_meta['episode_id']}_{idx}")
+        ids.append(f"{episode_id}_v{version}_{idx}")
         docs.append(str(ch.get("text", "")))
-        metas.append({
-            "episode_id": str(episode_meta.get("episode_id", "")),
+        meta = {
+            "episode_id": episode_id,
             "episode_title": str(episode_meta.get("episode_title", "")),
+            "version": int(version),
             "start_time": float(ch.get("start", 0.0)),
             "end_time": float(ch.get("end", 0.0)),
             "tokens": int(ch.get("tokens", 0)),
@@ -78,17 +452,25 @@ def upsert_episode(chunks, episode_meta, batch_size=200, replace=True):
             "top_speaker": str(top),
             "top_speaker_secs": float(top_secs),
             "speakers_json": json.dumps(speakers, ensure_ascii=False),
-        })
-
-    if not docs:
-        return
+        }
+        # one key per speaker, so speaker filters are plain metadata filters in every store
+        meta.update({speaker_key(label): secs for label, secs in speakers.items()})
+        metas.append(meta)
+        if len(docs) - len(embeddings) >= EMBED_ROWS:
+            embeddings += encode_cached(docs[len(embeddings):]).tolist()
+    if not ids:
+        if replace and episode_id:
+            delete_episode(episode_id)
+        return 0
+    if len(embeddings) < len(docs):
+        embeddings += encode_cached(docs[len(embeddings):]).tolist()
+    for meta in metas:
+        meta["n_chunks"] = len(ids)  # lets rebuild_catalog tell a complete version from a cut-short one
 
-    embeddings = emb.encode(docs, normalize_embeddings=True, show_progress_bar=False).tolist()
-    for i in range(0, len(docs), batch_size):
-        j = i + batch_size
-        coll.upsert(
-            ids=ids[i:j],
-            documents=docs[i:j],
-            metadatas=metas[i:j],
-            embeddings=embeddings[i:j],
-        )
+    _WRITER.submit({
+        "ids": ids, "docs": docs, "metas": metas, "embeddings": embeddings, "replace": replace,
+        "batch_size": int(batch_size) if batch_size else None,
+        "row": _catalog_row(episode_id, episode_meta.get("episode_title", ""), metas,
+                            episode_meta.get("fingerprint"), version),
+    })
+    return len(ids)
@@ -0,0 +1,164 @@
+# pipeline/embedder.py
+"""
+One embedding service shared by indexing and retrieval (one model copy per process).
+
+Backends (EMBED_BACKEND):
+    torch       SentenceTransformer as-is (default)
+    torch-int8  dynamic int8 quantization of the Linear layers (CPU)
+    onnx        ONNX Runtime via sentence-transformers >= 3.2
+    onnx-int8   the pre-quantized ONNX export shipped with the model repo, picked for this
+                CPU (AVX512-VNNI / AVX512 / AVX2 / ARM64); ONNX_FILE overrides the file
+"""
+import os
+import atexit
+import inspect
+import threading
+
+import numpy as np
+
+from .metrics import span
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# int8 exports in the sentence-transformers model repos, best first
+ONNX_INT8_FILES = (
+    ("AVX512VNNI", "onnx/model_qint8_avx512_vnni.onnx"),
+    ("AVX512F", "onnx/model_qint8_avx512.onnx"),
+    ("AVX2", "onnx/model_qint8_avx2.onnx"),
+    ("ASIMD", "onnx/model_qint8_arm64.onnx"),
+)
+
+_SERVICES = {}
+_SERVICES_LOCK = threading.Lock()
+
+
+def _cpu_features() -> dict:
+    try:
+        from numpy._core._multiarray_umath import __cpu_features__
+    except ImportError:
+        try:
+            from numpy.core._multiarray_umath import __cpu_features__
+        except ImportError:
+            return {}
+    return __cpu_features__
+
+
+def onnx_int8_file() -> str:
+    """ONNX_FILE if set, else the int8 export whose instruction set this CPU has."""
+    if os.getenv("ONNX_FILE"):
+        return os.getenv("ONNX_FILE")
+    features = _cpu_features()
+    for flag, file_name in ONNX_INT8_FILES:
+        if features.get(flag):
+            return file_name
+    return "onnx/model.onnx"  # unknown CPU: the fp32 export runs everywhere
+
+
+def _load_model(model_name: str, backend: str, device: str):
+    from sentence_transformers import SentenceTransformer
+
+    if backend in ("torch", "torch-int8"):
+        model = SentenceTransformer(model_name, device=device)
+        if backend == "torch-int8":
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    if backend in ("onnx", "onnx-int8"):
+        if "backend" not in inspect.signature(SentenceTransformer.__init__).parameters:
+            raise RuntimeError(f"EMBED_BACKEND={backend} needs sentence-transformers>=3.2 (with optimum/onnxruntime)")
+        kwargs = {"model_kwargs": {"file_name": onnx_int8_file()}} if backend == "onnx-int8" else {}
+        return SentenceTransformer(model_name, device=device, backend="onnx", **kwargs)
+
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+class EmbeddingService:
+    """Lazily loaded SentenceTransformer with batched, length-sorted, optionally multi-process encoding."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, backend: str | None = None,
+                 batch_size: int | None = None, processes: int | None = None, device: str = "cpu"):
+        self.model_name = model_name
+        self.backend = (backend or os.getenv("EMBED_BACKEND", "torch")).lower()
+        self.batch_size = int(batch_size or os.getenv("EMBED_BATCH_SIZE", "64"))
+        self.processes = int(processes if processes is not None else os.getenv("EMBED_PROCESSES", "0"))
+        self.device = device
+        self._model = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = _load_model(self.model_name, self.backend, self.device)
+        return self._model
+
+    @property
+    def variant(self) -> str:
+        """Model + numeric path (backend, ONNX file); vectors from different variants don't mix."""
+        if self.backend == "onnx-int8":
+            return f"{self.model_name}|{self.backend}|{onnx_int8_file()}"
+        return f"{self.model_name}|{self.backend}"
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def dim(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    def _multi_process_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = self.model.start_multi_process_pool(["cpu"] * self.processes)
+                    # worker processes outlive the interpreter otherwise
+                    atexit.register(self.close)
+        return self._pool
+
+    def encode(self, texts, batch_size: int | None = None, normalize: bool = True) -> np.ndarray:
+        """float32 matrix, one row per text, in input order."""
+        texts = [str(t) for t in texts]
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        with span("embed") as s:
+            out = self._encode(texts, batch_size or self.batch_size, normalize)
+            s.add(embeddings=len(texts))
+        return out
+
+    def _encode(self, texts, batch_size: int, normalize: bool) -> np.ndarray:
+        # SentenceTransformer only length-sorts inside one call; sort globally so
+        # multi-process chunks also see similar lengths and pad less
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        if self.processes > 1 and len(texts) >= 4 * batch_size:
+            vecs = self.model.encode_multi_process(sorted_texts, self._multi_process_pool(), batch_size=batch_size)
+            vecs = np.asarray(vecs, dtype=np.float32)
+            if normalize:
+                vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        else:
+            vecs = self.model.encode(sorted_texts, batch_size=batch_size, normalize_embeddings=normalize,
+                                     show_progress_bar=False, convert_to_numpy=True).astype(np.float32, copy=False)
+
+        out = np.empty_like(vecs)
+        out[order] = vecs
+        return out
+
+    def close(self):
+        """Stop the encode worker processes, if any were started."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            self.model.stop_multi_process_pool(pool)
+
+
+def get_embedding_service(model_name: str = DEFAULT_MODEL) -> EmbeddingService:
+    """Process-wide service per model name (backend/batching come from the environment)."""
+    with _SERVICES_LOCK:
+        svc = _SERVICES.get(model_name)
+        if svc is None:
+            svc = _SERVICES[model_name] = EmbeddingService(model_name)
+    return svc
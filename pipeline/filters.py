@@ -0,0 +1,134 @@
+# pipeline/filters.py
+"""
+Chroma-style `where` filters evaluated outside Chroma (lexical index, post-filtering).
+
+Supported: implicit equality, $eq/$ne/$gt/$gte/$lt/$lte/$in/$nin, $and/$or.
+
+Chunks carry one `spk_<label>` key per speaker (seconds spoken in the chunk),
+so speaker filters are ordinary metadata filters every store can push down.
+"""
+
+SPEAKER_PREFIX = "spk_"
+
+_OPS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def match(meta: dict, where: dict | None) -> bool:
+    """True if `meta` satisfies the filter (an empty/None filter matches everything)."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, arg in cond.items():
+                if op not in _OPS:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+                if not _OPS[op](value, arg):
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def episode_ids(where: dict | None) -> set | None:
+    """
+    Episode ids the filter is restricted to, or None if it doesn't pin episode_id.
+    Lets stores push the common scope filters down instead of post-filtering.
+    """
+    if not where:
+        return None
+    found = None
+    for key, cond in where.items():
+        ids = None
+        if key == "episode_id":
+            if isinstance(cond, dict):
+                if "$eq" in cond:
+                    ids = {cond["$eq"]}
+                elif "$in" in cond:
+                    ids = set(cond["$in"])
+            else:
+                ids = {cond}
+        elif key == "$or":
+            parts = [episode_ids(c) for c in cond]
+            if parts and all(p is not None for p in parts):
+                ids = set().union(*parts)
+        elif key == "$and":
+            for c in cond:
+                p = episode_ids(c)
+                if p is not None:
+                    ids = p if ids is None else ids & p
+        if ids is not None:
+            found = ids if found is None else found & ids
+    return found
+
+
+def speaker_key(label) -> str:
+    return f"{SPEAKER_PREFIX}{label}"
+
+
+def build_where(filters: dict | None = None, speaker=None, time_range=None) -> dict | None:
+    """
+    Combine a where filter with a speaker (label or list of labels: any of them speaks
+    in the chunk) and a (start, end) seconds range the chunk must overlap (either end may be None).
+    """
+    parts = [filters] if filters else []
+    if speaker:
+        labels = [speaker] if isinstance(speaker, str) else list(speaker)
+        conds = [{speaker_key(lab): {"$gt": 0.0}} for lab in labels]
+        parts.append(conds[0] if len(conds) == 1 else {"$or": conds})
+    if time_range:
+        start, end = time_range
+        if start is not None:
+            parts.append({"end_time": {"$gt": float(start)}})
+        if end is not None:
+            parts.append({"start_time": {"$lt": float(end)}})
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else {"$and": parts}
+
+
+def _requires_speech(cond) -> bool:
+    """True when a speaker-key condition rules out chunks where that speaker has 0 seconds."""
+    if not isinstance(cond, dict):
+        return False
+    num = lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)
+    return any((op == "$gt" and num(v) and v >= 0) or (op == "$gte" and num(v) and v > 0)
+               for op, v in cond.items())
+
+
+def speakers(where: dict | None) -> set | None:
+    """Speaker labels the filter is restricted to (a chunk must have one of them), or None."""
+    if not where:
+        return None
+    found = None
+    for key, cond in where.items():
+        labels = None
+        if key.startswith(SPEAKER_PREFIX) and _requires_speech(cond):
+            labels = {key[len(SPEAKER_PREFIX):]}
+        elif key == "$or":
+            parts = [speakers(c) for c in cond]
+            if parts and all(p is not None for p in parts):
+                labels = set().union(*parts)
+        elif key == "$and":
+            for c in cond:
+                p = speakers(c)
+                if p is not None:
+                    labels = p if labels is None else labels & p
+        if labels is not None:
+            found = labels if found is None else found & labels
+    return found
@@ -2,23 +2,32 @@ import os
 import imageio_ffmpeg as iio_ffm
 os.environ.setdefault("FFMPEG_BINARY", iio_ffm.get_ffmpeg_exe())
 
-import json
-import uuid
 import tempfile
 from pathlib import Path
+from contextlib import contextmanager
 import subprocess
 
-from faster_whisper import WhisperModel
+import numpy as np
+
+from . import transcript_cache
+from .transcript_cache import audio_digest
+from .transcript_store import EXT, copy_transcript, read_transcript
+from .metrics import span
 
 
 AUDIO_DIR = Path("storage/data")
 JSON_DIR = Path("storage/data")
-AUDIO_DIR.mkdir(parents=True, exist_ok=True)
-JSON_DIR.mkdir(parents=True, exist_ok=True)
+CHECKPOINT_DIR = Path("storage/data/checkpoints")  # writers create these on first use
+
+SAMPLE_RATE = 16000
+WHISPER_BEAM_SIZE = 5
+WHISPER_VAD_FILTER = True
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
 
 
 def load_audio(input_path: Path) -> str:
-    """Convert any input to 16 kHz mono WAV and return the temp WAV path."""
+    """Convert any input to 16 kHz mono WAV and return the temp WAV path (caller deletes it).
+    Prefer converted_wav, which never leaves the file behind."""
     tmp_wav = tempfile.NamedTemporaryFile(suffix=".wav", delete=False).name
     ffmpeg_exe = iio_ffm.get_ffmpeg_exe()  # absolute path to ffmpeg.exe
 
@@ -27,7 +36,7 @@ def load_audio(input_path: Path) -> str:
         ffmpeg_exe,
         "-y",
         "-i", str(input_path),
-        "-ar", "16000",
+        "-ar", str(SAMPLE_RATE),
         "-ac", "1",
         "-f", "wav",
         tmp_wav,
@@ -35,37 +44,78 @@ def load_audio(input_path: Path) -> str:
     try:
         subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     except FileNotFoundError as e:
+        os.unlink(tmp_wav)
         raise RuntimeError(f"ffmpeg not found at: {ffmpeg_exe}") from e
     except subprocess.CalledProcessError as e:
+        os.unlink(tmp_wav)
         raise RuntimeError(f"ffmpeg failed converting {input_path} -> {tmp_wav}") from e
 
     return tmp_wav
 
 
-def transcribe_with_whisper(wav_path: str, device: str | None = None, model_size: str | None = None):
-    import os
-    device = (device or os.getenv("WHISPER_DEVICE") or "cpu").lower()
-    model_size = model_size or os.getenv("WHISPER_MODEL", "medium")
+@contextmanager
+def converted_wav(input_path: Path):
+    """load_audio as a context manager: the temp WAV is removed on exit, even on errors."""
+    tmp_wav = load_audio(input_path)
+    try:
+        yield tmp_wav
+    finally:
+        try:
+            os.unlink(tmp_wav)
+        except FileNotFoundError:
+            pass
 
-    # If CPU, tell CTranslate2 to not even try CUDA
-    if device == "cpu":
-        os.environ["CT2_FORCE_CPU"] = "1"
 
-    model = WhisperModel(model_size, device=device, compute_type="auto")
-    segments, info = model.transcribe(
-        wav_path, beam_size=5, word_timestamps=True, vad_filter=True
-    )
-    words = []
-    for seg in segments:
-        if seg.words:
-            for w in seg.words:
-                words.append({"text": w.word, "start": float(w.start), "end": float(w.end)})
-    return words, getattr(info, "language", "en")
+def _pcm_cmd(input_path, start: float = 0.0):
+    """ffmpeg command writing 16 kHz mono float32 little-endian PCM to stdout."""
+    cmd = [iio_ffm.get_ffmpeg_exe(), "-nostdin", "-hide_banner", "-loglevel", "error"]
+    if start > 0:
+        cmd += ["-ss", f"{start:.3f}"]
+    cmd += ["-i", str(input_path), "-ar", str(SAMPLE_RATE), "-ac", "1", "-f", "f32le", "-"]
+    return cmd
 
 
-def diarize_with_pyannote(wav_path: str, hf_token_env: str = "HF_TOKEN"):
+def _open_pcm(input_path, start: float = 0.0):
+    cmd = _pcm_cmd(input_path, start)
+    try:
+        return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError as e:
+        raise RuntimeError(f"ffmpeg not found at: {cmd[0]}") from e
+
+
+def _close_pcm(proc, input_path, drained: bool):
+    """Reap ffmpeg; raise if it failed. `drained=False` means the reader stopped early."""
+    if not drained and proc.poll() is None:
+        # consumer stopped early (or failed); not an ffmpeg error
+        proc.kill()
+        proc.communicate()
+        return
+    _, err = proc.communicate()
+    if proc.returncode != 0:
+        msg = (err or b"").decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg failed decoding {input_path}: {msg}")
+
+
+def iter_audio_chunks(input_path, chunk_seconds: float = 30.0, start: float = 0.0):
+    """Yield consecutive float32 chunks of `chunk_seconds` (last one may be shorter)."""
+    chunk_bytes = int(chunk_seconds * SAMPLE_RATE) * 4
+    proc = _open_pcm(input_path, start)
+    drained = False
+    try:
+        while True:
+            block = proc.stdout.read(chunk_bytes)
+            if not block:
+                break
+            usable = len(block) - len(block) % 4
+            yield np.frombuffer(bytearray(block[:usable]), dtype=np.float32)
+        drained = True
+    finally:
+        _close_pcm(proc, input_path, drained)
+
+
+def diarize_with_pyannote(audio, hf_token_env: str = "HF_TOKEN"):
     """
-    Optional diarization.
+    Optional diarization. `audio` is a file path or a 16 kHz mono float32 array.
     Returns a list of turns: [{"speaker": str, "start": float, "end": float}, ...]
     If token missing or any error occurs, returns [] (single-speaker fallback will be used).
     """
@@ -76,9 +126,13 @@ def diarize_with_pyannote(wav_path: str, hf_token_env: str = "HF_TOKEN"):
         # Import inside function so the module isn’t required if diarization is off
         from pyannote.audio import Pipeline as DiarizationPipeline
         pipeline = DiarizationPipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1", use_auth_token=token
+            DIARIZATION_MODEL, use_auth_token=token
         )
-        diarization = pipeline({"audio": wav_path})
+        if isinstance(audio, np.ndarray):
+            import torch
+            diarization = pipeline({"waveform": torch.from_numpy(audio).unsqueeze(0), "sample_rate": SAMPLE_RATE})
+        else:
+            diarization = pipeline({"audio": str(audio)})
         turns = []
         for turn, _, speaker in diarization.itertracks(yield_label=True):
             turns.append({"speaker": speaker, "start": float(turn.start), "end": float(turn.end)})
@@ -88,38 +142,102 @@ def diarize_with_pyannote(wav_path: str, hf_token_env: str = "HF_TOKEN"):
         return []
 
 
-def save_episode_json(episode_title: str, wav_path: str, words: list, turns: list, language: str):
-    """Persist episode JSON and return (json_path, episode_id)."""
-    episode_id = str(uuid.uuid4())[:8]
-    out = {
-        "episode_id": episode_id,
-        "episode_title": episode_title,
-        "audio_path": wav_path,
-        "language": language,
-        "words": words,
-        "turns": turns,
-    }
-    out_path = JSON_DIR / f"{episode_id}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
-    return out_path, episode_id
+def transcript_fingerprint(model_size: str | None = None, diarize: bool | None = None) -> str:
+    """Fingerprint of every setting that changes words/turns for the same audio."""
+    if diarize is None:
+        diarize = bool(os.getenv("HF_TOKEN"))
+    return transcript_cache.config_fingerprint(
+        whisper_model=model_size or os.getenv("WHISPER_MODEL", "medium"),
+        beam_size=WHISPER_BEAM_SIZE,
+        vad_filter=WHISPER_VAD_FILTER,
+        diarization_model=DIARIZATION_MODEL if diarize else None,
+    )
+
+
+def episode_id_for(digest: str) -> str:
+    """Stable episode id: identical audio always maps to the same id (and index entries)."""
+    return digest[:12]
 
 
 def process_episode(file_path: Path, title: str):
     """
-    Full pipeline for one file: convert -> transcribe -> (optional) diarize -> save JSON.
+    Full pipeline for one file: convert -> transcribe -> (optional) diarize -> save transcript.
+    Results are cached by audio content + settings; identical re-uploads skip all decoding.
+    Transcription is checkpointed per segment, so a crashed run resumes where it stopped.
     Falls back to a single speaker if diarization is unavailable.
-    Returns (episode_json_path, episode_id).
+    Returns (episode_path, episode_id); load it with transcript_store.load_episode.
+    """
+    with span("process_episode") as s:
+        digest = audio_digest(file_path)
+        fingerprint = transcript_fingerprint()
+        episode_id = episode_id_for(digest)
+
+        cached = transcript_cache.load(digest, fingerprint)
+        s.add(cache_hits=int(cached is not None))
+        if cached is None:
+            with span("transcribe") as t:
+                cached = _transcribe_to_cache(file_path, digest, fingerprint)
+                t.add(**_transcript_items(cached))
+
+        out_path = JSON_DIR / f"{episode_id}{EXT}"
+        copy_transcript(cached, out_path, episode_id=episode_id, episode_title=title, audio_path=str(file_path))
+        s.add(**_transcript_items(out_path))
+    return out_path, episode_id
+
+
+def _transcript_items(path) -> dict:
+    """Span item counts for a transcript file (audio seconds ~ last word end)."""
+    tr = read_transcript(path)
+    return {"audio_secs": float(tr.end.max()) if len(tr) else 0.0, "words": len(tr)}
+
+
+def _transcribe_to_cache(file_path: Path, digest: str, fingerprint: str) -> Path:
+    """
+    Transcribe (+ diarize) into the transcript cache and return the entry's path.
+    A result is only stored under `fingerprint` if it has what the fingerprint claims:
+    when diarization was asked for but produced no turns (pyannote/HF failure), the
+    single-speaker fallback goes under the diarization-off fingerprint instead, and the
+    next run reuses its words and only retries diarization.
     """
-    wav = load_audio(file_path)
-    words, lang = transcribe_with_whisper(wav)
-    turns = diarize_with_pyannote(wav)
+    from .longform import transcribe_resumable, iter_checkpoint_words
+
+    diarize = bool(os.getenv("HF_TOKEN"))
+    plain_fp = transcript_fingerprint(diarize=False)
+    plain = transcript_cache.load(digest, plain_fp) if diarize else None
+
+    ckpt = CHECKPOINT_DIR / f"{digest}-{fingerprint}.words.jsonl"
+    if plain is not None:
+        # Whisper already ran for this audio; an earlier diarization attempt failed
+        tr = read_transcript(plain)
+        lang = tr.language
+        words = tr.words
+    else:
+        lang = transcribe_resumable(file_path, ckpt)
+        words = lambda: iter_checkpoint_words(ckpt)
+
+    # pyannote reads a file path window by window, so hand it a temp 16 kHz WAV
+    # instead of the decoded waveform (memory stays flat on long episodes)
+    turns = []
+    if diarize:
+        with span("diarize"), converted_wav(file_path) as wav:
+            turns = diarize_with_pyannote(wav)
 
     if not turns:
+        if plain is not None:
+            return plain
+        fingerprint = plain_fp
         # single-speaker fallback covering the clip
-        if words:
-            turns = [{"speaker": "SPK0", "start": words[0]["start"], "end": words[-1]["end"]}]
+        first = last = None
+        for w in words():
+            if first is None:
+                first = w["start"]
+            last = w["end"]
+        if first is not None:
+            turns = [{"speaker": "SPK0", "start": first, "end": last}]
         else:
             turns = [{"speaker": "SPK0", "start": 0.0, "end": 0.0}]
 
-    return save_episode_json(title, wav, words, turns, lang)
+    # words stream straight from the checkpoint (or cached transcript) into the columnar file
+    path = transcript_cache.store(digest, fingerprint, words(), turns, lang)
+    ckpt.unlink(missing_ok=True)
+    return path
@@ -0,0 +1,175 @@
+# pipeline/jobs.py
+"""
+Persistent ingestion job queue (SQLite), shared by the app and pipeline.worker.
+
+States: queued -> running -> done | failed. A failed attempt goes back to
+queued (after a delay) until JOB_MAX_ATTEMPTS; each job records its current
+stage and a 0..1 progress value for the UI to poll.
+
+Kinds: "ingest" (file + title), "delete" (file = episode id) and "wipe". Index
+changes all go through here so the worker stays the only writer.
+"""
+import os
+import time
+import threading
+
+from .db import connect
+
+JOBS_PATH = os.getenv("JOBS_PATH", "storage/jobs.sqlite")
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))  # running job with no heartbeat -> requeued
+
+_COLUMNS = ("id", "file", "title", "state", "stage", "progress", "attempts", "max_attempts",
+            "error", "episode_id", "worker", "created", "updated", "kind")
+KINDS = ("ingest", "delete", "wipe")
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+class JobQueue:
+    def __init__(self, path: str = JOBS_PATH):
+        self._conn = connect(path)
+        self._lock = threading.Lock()
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, file TEXT NOT NULL, title TEXT NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'queued', stage TEXT NOT NULL DEFAULT '',"
+            " progress REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0,"
+            " max_attempts INTEGER NOT NULL, error TEXT, episode_id TEXT, worker TEXT,"
+            " run_after REAL NOT NULL DEFAULT 0, heartbeat REAL NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL, updated REAL NOT NULL, kind TEXT NOT NULL DEFAULT 'ingest');"
+            "CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, run_after);"
+            "CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL);"
+        )
+        if "kind" not in {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)")}:
+            # queues from before delete/wipe jobs only ever held ingests
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'ingest'")
+
+    def _write(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args)
+
+    def _rows(self, sql, args=()) -> list:
+        with self._lock:
+            return [dict(zip(_COLUMNS, r)) for r in self._conn.execute(sql, args).fetchall()]
+
+    # ---------- producer side ----------
+    def enqueue(self, file, title: str, max_attempts: int | None = None, kind: str = "ingest") -> int:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        now = time.time()
+        cur = self._write(
+            "INSERT INTO jobs (file, title, max_attempts, created, updated, kind) VALUES (?, ?, ?, ?, ?, ?)",
+            (str(file), str(title), int(max_attempts or MAX_ATTEMPTS), now, now, kind),
+        )
+        return int(cur.lastrowid)
+
+    def get(self, job_ids) -> list:
+        """Jobs by id, in the order given (unknown ids are skipped)."""
+        job_ids = [int(i) for i in job_ids]
+        if not job_ids:
+            return []
+        rows = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})", job_ids)
+        by_id = {r["id"]: r for r in rows}
+        return [by_id[i] for i in job_ids if i in by_id]
+
+    def recent(self, limit: int = 20) -> list:
+        return self._rows(f"SELECT {', '.join(_COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (int(limit),))
+
+    # ---------- worker side ----------
+    def claim(self, worker: str, kind: str | None = None) -> dict | None:
+        """Atomically take the oldest runnable job, optionally of one kind (also across processes)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # out of attempts (e.g. requeued by an older version): fail instead of running again
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'failed', updated = ? WHERE state = 'queued' AND attempts >= max_attempts",
+                    (now,),
+                )
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE state = 'queued' AND run_after <= ? AND kind = coalesce(?, kind)"
+                    " ORDER BY id LIMIT 1", (now, kind)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'running', stage = 'queued', progress = 0, attempts = attempts + 1,"
+                        " worker = ?, heartbeat = ?, updated = ? WHERE id = ?", (worker, now, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get([row[0]])[0] if row else None
+
+    def progress(self, job_id: int, stage: str, progress: float):
+        now = time.time()
+        self._write("UPDATE jobs SET stage = ?, progress = ?, heartbeat = ?, updated = ? WHERE id = ?",
+                    (stage, float(progress), now, now, int(job_id)))
+
+    def heartbeat(self, job_id: int):
+        self._write("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), int(job_id)))
+
+    def complete(self, job_id: int, episode_id: str):
+        now = time.time()
+        self._write("UPDATE jobs SET state = 'done', stage = 'done', progress = 1, episode_id = ?, error = NULL,"
+                    " updated = ? WHERE id = ?", (str(episode_id), now, int(job_id)))
+
+    def fail(self, job_id: int, error: str) -> str:
+        """Record a failed attempt; returns the new state ("queued" for a retry, or "failed")."""
+        now = time.time()
+        with self._lock:
+            attempts, max_attempts = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (int(job_id),)).fetchone()
+            state = "queued" if attempts < max_attempts else "failed"
+            self._conn.execute("UPDATE jobs SET state = ?, error = ?, run_after = ?, updated = ? WHERE id = ?",
+                               (state, str(error), now + RETRY_DELAY * attempts, now, int(job_id)))
+        return state
+
+    def requeue_stale(self, stale_seconds: float = STALE_SECONDS) -> int:
+        """
+        Running jobs whose worker stopped heartbeating (crash, kill) go back to the queue,
+        or to failed once they are out of attempts (a job that kills its worker every time).
+        """
+        now = time.time()
+        cur = self._write("UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,"
+                          " error = 'worker lost', updated = ? WHERE state = 'running' AND heartbeat < ?",
+                          (now, now - stale_seconds))
+        return cur.rowcount
+
+    # ---------- single-worker lease ----------
+    def acquire_lease(self, holder: str, ttl: float = 60.0, name: str = "worker") -> bool:
+        """Take or renew the named lease; False if another live holder has it."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT holder, expires FROM lease WHERE name = ?", (name,)).fetchone()
+                ok = row is None or row[0] == holder or row[1] < now
+                if ok:
+                    self._conn.execute("INSERT OR REPLACE INTO lease (name, holder, expires) VALUES (?, ?, ?)",
+                                       (name, holder, now + ttl))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ok
+
+    def release_lease(self, holder: str, name: str = "worker"):
+        self._write("DELETE FROM lease WHERE name = ? AND holder = ?", (name, holder))
+
+    def lease_alive(self, name: str = "worker") -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT expires FROM lease WHERE name = ?", (name,)).fetchone()
+        return bool(row and row[0] >= time.time())
+
+
+def get_job_queue() -> JobQueue:
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = JobQueue()
+    return _QUEUE
@@ -0,0 +1,189 @@
+# pipeline/lexical.py
+"""
+BM25 inverted index over the same chunks that go into the vector store.
+
+Kept in SQLite next to the vector store and updated by upsert_episode /
+delete_episode, so exact names, jargon and quoted phrases can be recalled
+without a dense hit (or a CrossEncoder pass). Speaker postings (chunk -> seconds
+per diarized speaker) let speaker-scoped searches skip other speakers' chunks.
+"""
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+
+from .db import connect
+
+LEXICAL_PATH = os.getenv("LEXICAL_INDEX_PATH", "storage/lexical.sqlite")
+BM25_K1 = 1.2
+BM25_B = 0.75
+_SQL_VARS = 500
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+class LexicalIndex:
+    def __init__(self, path: str = LEXICAL_PATH):
+        self._conn = connect(path)
+        self._lock = threading.Lock()
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " chunk_id TEXT PRIMARY KEY, episode_id TEXT NOT NULL, length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS docs_episode ON docs(episode_id);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk_id);"
+            "CREATE TABLE IF NOT EXISTS speakers ("
+            " speaker TEXT NOT NULL, chunk_id TEXT NOT NULL, secs REAL NOT NULL,"
+            " PRIMARY KEY (speaker, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS speakers_chunk ON speakers(chunk_id);"
+        )
+        self._stats = None  # (n_docs, avg_len), recomputed after writes
+
+    def _delete_ids(self, ids):
+        for i in range(0, len(ids), _SQL_VARS):
+            part = ids[i:i + _SQL_VARS]
+            marks = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", part)
+            self._conn.execute(f"DELETE FROM docs WHERE chunk_id IN ({marks})", part)
+            self._conn.execute(f"DELETE FROM speakers WHERE chunk_id IN ({marks})", part)
+
+    def add(self, ids, texts, episode_ids, speakers=None):
+        """Index (or re-index) chunks; `speakers` is one {label: seconds} per chunk. One transaction per call."""
+        docs, posts, spk = [], [], []
+        for cid, text, eid, who in zip(ids, texts, episode_ids, speakers or [{}] * len(ids)):
+            tf = Counter(tokenize(text))
+            docs.append((cid, str(eid), sum(tf.values())))
+            posts.extend((term, cid, n) for term, n in tf.items())
+            spk.extend((str(label), cid, float(secs)) for label, secs in (who or {}).items())
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_ids(list(ids))
+                self._conn.executemany("INSERT INTO docs (chunk_id, episode_id, length) VALUES (?, ?, ?)", docs)
+                self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posts)
+                self._conn.executemany("INSERT INTO speakers (speaker, chunk_id, secs) VALUES (?, ?, ?)", spk)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._stats = None
+
+    def delete(self, ids):
+        """Remove chunks by id (e.g. superseded versions); one transaction."""
+        ids = list(ids)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_ids(ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._stats = None
+
+    def delete_episode(self, episode_id):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for table in ("postings", "speakers"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE chunk_id IN (SELECT chunk_id FROM docs WHERE episode_id = ?)",
+                    (str(episode_id),),
+                )
+            self._conn.execute("DELETE FROM docs WHERE episode_id = ?", (str(episode_id),))
+            self._conn.execute("COMMIT")
+            self._stats = None
+
+    def wipe(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM speakers")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("COMMIT")
+            self._stats = None
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0])
+
+    def _corpus_stats(self):
+        if self._stats is None:
+            n, avg = self._conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            self._stats = (int(n), float(avg or 0.0))
+        return self._stats
+
+    def search(self, query: str, k: int = 15, episode_ids=None, speakers=None) -> list:
+        """Top-k (chunk_id, bm25 score), optionally restricted to episode ids and/or speakers."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        scope, args = "", []
+        if episode_ids is not None:
+            episode_ids = [str(e) for e in episode_ids]
+            if not episode_ids:
+                return []
+            scope += f" AND d.episode_id IN ({','.join('?' * len(episode_ids))})"
+            args += episode_ids
+        if speakers is not None:
+            speakers = [str(s) for s in speakers]
+            if not speakers:
+                return []
+            scope += (" AND p.chunk_id IN (SELECT chunk_id FROM speakers"
+                      f" WHERE secs > 0 AND speaker IN ({','.join('?' * len(speakers))}))")
+            args += speakers
+
+        scores = {}
+        with self._lock:
+            n_docs, avg_len = self._corpus_stats()
+            if n_docs == 0:
+                return []
+            for term in terms:
+                df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if not df:
+                    continue
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN docs d ON d.chunk_id = p.chunk_id"
+                    f" WHERE p.term = ?{scope}", [term, *args],
+                ).fetchall()
+                for cid, tf, length in rows:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_len or 1.0))
+                    scores[cid] = scores.get(cid, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda x: -x[1])[:k]
+
+    def rebuild_from(self, coll, page: int = 1000):
+        """Backfill from an existing vector collection (indexes created before this store existed)."""
+        total = int(coll.count())
+        for offset in range(0, total, page):
+            got = coll.get(include=["documents", "metadatas"], limit=page, offset=offset)
+            metas = [m or {} for m in got.get("metadatas") or []]
+            self.add(got["ids"], got.get("documents") or [], [m.get("episode_id", "") for m in metas],
+                     [json.loads(m.get("speakers_json") or "{}") for m in metas])
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = LexicalIndex()
+    return _INDEX
+
+
+def rrf_fuse(rankings, k: int = 60) -> list:
+    """Reciprocal-rank fusion of several ranked id lists -> [(id, score)] best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda x: -x[1])
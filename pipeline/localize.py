@@ -0,0 +1,132 @@
+# pipeline/localize.py
+"""
+Sentence-level timestamp index, so a hit can point at the exact moment
+instead of its whole (multi-minute) window.
+
+One file per episode, written at ingest next to the transcript:
+    storage/data/<episode_id>.sentences.arrow   (uncompressed Arrow IPC, memory-mapped)
+        start  float64   sentence start (s), rows sorted by start
+        end    float64
+        text   string
+
+localize(hit, query) binary-searches the hit's [start_time, end_time] in the
+start column and scores only that slice: one regex count per query term over
+the lower-cased texts (pyarrow compute), weighted by in-window IDF. Episodes
+indexed before this existed get their file built once from the transcript.
+"""
+import re
+import math
+import threading
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .lexical import tokenize
+from .lru import TTLCache
+from .transcript_store import EXT, _write_table, read_transcript
+
+DATA_DIR = Path("storage/data")  # same place ingest writes <episode_id>.arrow
+SENT_EXT = ".sentences.arrow"
+
+SCHEMA = pa.schema([
+    ("start", pa.float64()),
+    ("end", pa.float64()),
+    ("text", pa.string()),
+])
+
+# episode_id -> (mtime, table); the memory maps stay open while cached
+_TABLES = TTLCache(maxsize=64)
+_BUILD_LOCK = threading.Lock()
+
+
+def sentence_index_path(episode_id: str) -> Path:
+    return DATA_DIR / f"{episode_id}{SENT_EXT}"
+
+
+def write_sentence_index(episode_id: str, sentences) -> Path:
+    """Persist aligned sentences (dicts with start/end/text) for one episode."""
+    sentences = sorted(sentences, key=lambda s: s["start"])
+    table = pa.Table.from_arrays(
+        [pa.array(np.fromiter((s["start"] for s in sentences), dtype=np.float64, count=len(sentences))),
+         pa.array(np.fromiter((s["end"] for s in sentences), dtype=np.float64, count=len(sentences))),
+         pa.array([s["text"] for s in sentences], pa.string())],
+        schema=SCHEMA,
+    )
+    path = sentence_index_path(episode_id)
+    _write_table(table, path)
+    return path
+
+
+def _build_from_transcript(episode_id: str):
+    from .align import sentences_from_transcript
+
+    src = DATA_DIR / f"{episode_id}{EXT}"
+    if not src.exists():
+        return None
+    return write_sentence_index(episode_id, sentences_from_transcript(read_transcript(src)))
+
+
+def load_sentence_index(episode_id: str):
+    """Memory-mapped sentence table for an episode (built on first use if missing), or None."""
+    path = sentence_index_path(episode_id)
+    if not path.exists():
+        with _BUILD_LOCK:
+            if not path.exists() and _build_from_transcript(episode_id) is None:
+                return None
+    mtime = path.stat().st_mtime_ns
+    cached = _TABLES.get(episode_id)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    _TABLES.put(episode_id, (mtime, table))
+    return table
+
+
+def _term_scores(texts: pa.Array, terms) -> np.ndarray:
+    """Per-sentence sum of idf-weighted hits of each query term (prefix match on word starts)."""
+    lower = pc.utf8_lower(texts)
+    n = len(texts)
+    score = np.zeros(n, dtype=np.float64)
+    for term in terms:
+        counts = pc.count_substring_regex(lower, r"\b" + re.escape(term)).to_numpy(zero_copy_only=False)
+        df = int(np.count_nonzero(counts))
+        if df:
+            score += np.log1p(counts) * math.log(1 + n / df)
+    return score
+
+
+def localize(hit, query: str):
+    """
+    Best-matching sentence inside a (id, text, meta) hit:
+    {"start", "end", "text", "score"}, or None when the episode has no sentence index
+    or no query term occurs in the window.
+    """
+    meta = hit[2] or {}
+    eid = meta.get("episode_id")
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not eid or not terms:
+        return None
+    table = load_sentence_index(str(eid))
+    if table is None or not table.num_rows:
+        return None
+
+    starts = table.column("start").to_numpy()
+    # float64 matches the chunk bounds exactly; the 1 ms slack covers files written as float32
+    lo = int(np.searchsorted(starts, float(meta.get("start_time", 0.0)) - 1e-3, side="left"))
+    hi = int(np.searchsorted(starts, float(meta.get("end_time", 0.0)) + 1e-3, side="left"))
+    if hi <= lo:
+        return None
+    window = table.slice(lo, hi - lo)
+    scores = _term_scores(window.column("text").combine_chunks(), terms)
+    best = int(np.argmax(scores))
+    if scores[best] <= 0:
+        return None
+    row = lo + best
+    return {
+        "start": round(float(starts[row]), 3),
+        "end": round(float(table.column("end")[row].as_py()), 3),
+        "text": table.column("text")[row].as_py(),
+        "score": round(float(scores[best]), 4),
+    }
@@ -0,0 +1,169 @@
+# pipeline/longform.py
+"""
+Chunked, resumable transcription for long episodes.
+
+Audio is streamed from ffmpeg, cut into ~segment_seconds pieces at silences found
+by the Silero VAD that ships with faster-whisper, and every finished segment is
+appended to a JSON-lines checkpoint. After a crash, transcription restarts at the
+end of the last completed segment. Memory stays bounded by a couple of segments.
+"""
+import os
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .ingest import SAMPLE_RATE, WHISPER_BEAM_SIZE, WHISPER_VAD_FILTER, iter_audio_chunks
+from .whisper_pool import get_whisper_pool
+
+SEARCH_SECONDS = 30.0  # how far around the target length we look for a silence
+
+
+def _silence_cut(audio: np.ndarray, target: int, search: int) -> int:
+    """Sample index near `target` that falls in the widest non-speech gap."""
+    lo, hi = max(0, target - search), min(len(audio), target + search)
+    window = audio[lo:hi]
+    try:
+        from faster_whisper.vad import get_speech_timestamps
+        speech = get_speech_timestamps(window)
+    except Exception:
+        speech = None
+
+    if speech:
+        edges = [0] + [x for s in speech for x in (s["start"], s["end"])] + [len(window)]
+        gaps = [(edges[i], edges[i + 1]) for i in range(0, len(edges), 2) if edges[i + 1] > edges[i]]
+        if gaps:
+            a, b = max(gaps, key=lambda g: (g[1] - g[0], -abs((g[0] + g[1]) // 2 + lo - target)))
+            return lo + (a + b) // 2
+    if speech == []:
+        return target
+
+    # VAD unavailable or no gap: quietest 20 ms frame
+    frame = SAMPLE_RATE // 50
+    n = len(window) // frame
+    if n == 0:
+        return target
+    energy = np.square(window[: n * frame].reshape(n, frame)).mean(axis=1)
+    return lo + int(np.argmin(energy)) * frame + frame // 2
+
+
+def iter_segments(input_path, segment_seconds: float = 600.0, start: float = 0.0, first_index: int = 0):
+    """Yield (index, offset_secs, audio) for consecutive VAD-cut segments starting at `start`."""
+    target = int(segment_seconds * SAMPLE_RATE)
+    search = int(min(SEARCH_SECONDS, segment_seconds / 4) * SAMPLE_RATE)
+    buf = np.empty(0, dtype=np.float32)
+    offset, idx = float(start), int(first_index)
+
+    for block in iter_audio_chunks(input_path, chunk_seconds=segment_seconds, start=start):
+        buf = np.concatenate([buf, block]) if len(buf) else block
+        while len(buf) >= target + search:
+            cut = _silence_cut(buf, target, search)
+            yield idx, offset, buf[:cut]
+            buf = buf[cut:].copy()
+            offset += cut / SAMPLE_RATE
+            idx += 1
+    if len(buf):
+        yield idx, offset, buf
+
+
+def read_checkpoint(checkpoint_path) -> dict:
+    """
+    Completed segments of a checkpoint:
+    {"segments": n, "resume_at": secs, "language": str | None, "done": bool}.
+    A torn trailing line (crash mid-write) is dropped.
+    """
+    state = {"segments": 0, "resume_at": 0.0, "language": None, "done": False}
+    if not os.path.exists(checkpoint_path):
+        return state
+    good_bytes = 0
+    with open(checkpoint_path, "rb") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            good_bytes += len(line)
+            if rec.get("done"):
+                state["done"] = True
+                continue
+            state["segments"] = rec["segment"] + 1
+            state["resume_at"] = float(rec["end"])
+            state["language"] = state["language"] or rec.get("language")
+    if good_bytes < os.path.getsize(checkpoint_path):
+        with open(checkpoint_path, "r+b") as f:
+            f.truncate(good_bytes)
+    return state
+
+
+def iter_checkpoint_words(checkpoint_path):
+    """Stream word dicts back out of a checkpoint, one segment at a time."""
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec.get("done"):
+                continue
+            yield from rec["words"]
+
+
+def _transcribe_segment(pool, idx, offset, audio):
+    segments, info = pool.transcribe(
+        audio, beam_size=WHISPER_BEAM_SIZE, word_timestamps=True, vad_filter=WHISPER_VAD_FILTER
+    )
+    words = []
+    for seg in segments:
+        if seg.words:
+            for w in seg.words:
+                words.append({"text": w.word, "start": offset + float(w.start), "end": offset + float(w.end)})
+    return {
+        "segment": idx,
+        "start": offset,
+        "end": offset + len(audio) / SAMPLE_RATE,
+        "language": getattr(info, "language", None),
+        "words": words,
+    }
+
+
+def transcribe_resumable(input_path, checkpoint_path, segment_seconds: float | None = None,
+                         workers: int | None = None, device: str | None = None,
+                         model_size: str | None = None) -> str:
+    """
+    Transcribe `input_path` into `checkpoint_path`, resuming if it already holds
+    completed segments. Up to `workers` segments decode concurrently; results are
+    appended strictly in order so the checkpoint is always a contiguous prefix.
+    Returns the detected language.
+    """
+    segment_seconds = float(segment_seconds or os.getenv("WHISPER_SEGMENT_SECONDS", "600"))
+    workers = max(1, int(workers or os.getenv("WHISPER_SEGMENT_WORKERS", "1")))
+
+    state = read_checkpoint(checkpoint_path)
+    if state["done"]:
+        return state["language"] or "en"
+
+    pool = get_whisper_pool(model_size=model_size, device=device, size=workers)
+    language = state["language"]
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+
+    with open(checkpoint_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as ex:
+        def flush(rec):
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+        inflight = deque()
+        for idx, offset, audio in iter_segments(input_path, segment_seconds, state["resume_at"], state["segments"]):
+            inflight.append(ex.submit(_transcribe_segment, pool, idx, offset, audio))
+            del audio
+            if len(inflight) >= workers:
+                rec = inflight.popleft().result()
+                language = language or rec["language"]
+                flush(rec)
+        while inflight:
+            rec = inflight.popleft().result()
+            language = language or rec["language"]
+            flush(rec)
+        flush({"done": True})
+
+    return language or "en"
@@ -0,0 +1,264 @@
+# pipeline/metrics.py
+"""
+Lightweight stage instrumentation.
+
+    with span("upsert_episode") as s:
+        ...
+        s.add(chunks=len(chunks))
+
+    @timed("align")
+    def assign_speakers(...): ...
+
+Each finished span records wall seconds, CPU seconds, the process's resident
+memory when it ended and how much that grew during the span, and item counts
+(audio_secs, words, chunks, embeddings, ...). Records are kept in a rolling
+in-process window and appended to METRICS_PATH (JSON lines) by a background
+thread, so the app can summarize stages that ran in the worker process too.
+
+CLI:
+    python -m pipeline.metrics               # p50/p95 table from the log
+    python -m pipeline.metrics --prometheus  # Prometheus text format
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+import functools
+from queue import SimpleQueue, Empty
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_PATH = os.getenv("METRICS_PATH", "storage/metrics.jsonl")
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "500"))
+METRICS_MAX_BYTES = int(os.getenv("METRICS_MAX_BYTES", str(10 << 20)))
+
+_RECENT = {}  # stage -> deque of records
+_LOCK = threading.Lock()
+_PENDING = SimpleQueue()  # records not yet in the log
+_WRITE_LOCK = threading.Lock()
+_WRITER = None
+
+
+def rss_mb() -> float:
+    """Current resident set size; where that is not readable, the lifetime peak instead."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+class Span:
+    __slots__ = ("stage", "items")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.items = {}
+
+    def add(self, **items):
+        for k, v in items.items():
+            self.items[k] = self.items.get(k, 0) + v
+
+
+def _append_log(recs: list):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(METRICS_PATH)), exist_ok=True)
+        if os.path.exists(METRICS_PATH) and os.path.getsize(METRICS_PATH) > METRICS_MAX_BYTES:
+            os.replace(METRICS_PATH, METRICS_PATH + ".1")
+        with open(METRICS_PATH, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in recs))
+    except OSError as e:
+        print(f"[metrics] {e}")
+
+
+def _drain(recs: list):
+    with _WRITE_LOCK:
+        while True:
+            try:
+                recs.append(_PENDING.get_nowait())
+            except Empty:
+                break
+        if recs:
+            _append_log(recs)
+
+
+def flush():
+    """Write every pending record to the log (the writer thread does this continuously)."""
+    _drain([])
+
+
+def _writer():
+    while True:
+        _drain([_PENDING.get()])  # block until something arrives, then write the whole batch
+
+
+def record(rec: dict):
+    """Keep the record in the in-process window; file I/O happens off the caller's thread."""
+    global _WRITER
+    with _LOCK:
+        _RECENT.setdefault(rec["stage"], deque(maxlen=METRICS_WINDOW)).append(rec)
+        if _WRITER is None:
+            _WRITER = threading.Thread(target=_writer, name="metrics-writer", daemon=True)
+            _WRITER.start()
+            atexit.register(flush)
+    _PENDING.put(rec)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block; the record is written even if the block raises (with ok=False)."""
+    s = Span(stage)
+    if not METRICS_ENABLED:
+        yield s
+        return
+    t0, c0, m0 = time.perf_counter(), time.process_time(), rss_mb()
+    ok = True
+    try:
+        yield s
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        m1 = rss_mb()
+        record({
+            "ts": time.time(),
+            "stage": stage,
+            "wall_s": round(time.perf_counter() - t0, 6),
+            "cpu_s": round(time.process_time() - c0, 6),
+            "rss_mb": round(m1, 1),
+            "rss_delta_mb": round(m1 - m0, 1),
+            "items": s.items,
+            "ok": ok,
+            "pid": os.getpid(),
+        })
+
+
+def timed(stage: str):
+    """Decorator form of span() (no item counts)."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def read_log(path: str = METRICS_PATH, max_bytes: int = 1 << 20) -> list:
+    """Records from the tail of the JSON-lines log (all processes)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        lines = f.read().splitlines()
+    if size > max_bytes:
+        lines = lines[1:]  # first line is probably cut
+    out = []
+    for line in lines:
+        try:
+            out.append(json.loads(line))
+        except ValueError:
+            continue
+    return out
+
+
+def summarize(records=None) -> dict:
+    """
+    stage -> count, p50/p95 wall seconds, mean CPU seconds, max RSS at the end of a run
+    and max RSS growth during one, item totals
+    and per-item throughput (e.g. audio_secs per wall second = real-time factor).
+    Defaults to the last METRICS_WINDOW records per stage from the log, or this process.
+    """
+    if records is None:
+        flush()
+        records = read_log() if METRICS_ENABLED and os.path.exists(METRICS_PATH) else \
+            [r for d in list(_RECENT.values()) for r in list(d)]
+    by_stage = {}
+    for r in records:
+        by_stage.setdefault(r["stage"], []).append(r)
+
+    out = {}
+    for stage, recs in sorted(by_stage.items()):
+        recs = recs[-METRICS_WINDOW:]
+        wall = np.array([r["wall_s"] for r in recs])
+        items = {}
+        for r in recs:
+            for k, v in (r.get("items") or {}).items():
+                items[k] = items.get(k, 0) + v
+        total_wall = float(wall.sum())
+        out[stage] = {
+            "count": len(recs),
+            "p50_s": round(float(np.percentile(wall, 50)), 4),
+            "p95_s": round(float(np.percentile(wall, 95)), 4),
+            "cpu_mean_s": round(float(np.mean([r["cpu_s"] for r in recs])), 4),
+            # logs written before rss_mb existed only have the lifetime peak
+            "rss_mb": max(r.get("rss_mb", r.get("peak_rss_mb", 0.0)) for r in recs),
+            "rss_delta_mb": max(r.get("rss_delta_mb", 0.0) for r in recs),
+            "errors": sum(1 for r in recs if not r.get("ok", True)),
+            "items": items,
+            "per_second": {k: round(v / total_wall, 2) for k, v in items.items()} if total_wall > 0 else {},
+        }
+    return out
+
+
+def prometheus_text(summary=None) -> str:
+    """Summary in Prometheus exposition format (e.g. for a node_exporter textfile collector)."""
+    summary = summary if summary is not None else summarize()
+    lines = [
+        "# HELP podcast_rag_stage_seconds Wall time per pipeline stage.",
+        "# TYPE podcast_rag_stage_seconds summary",
+    ]
+    for stage, s in summary.items():
+        lines.append(f'podcast_rag_stage_seconds{{stage="{stage}",quantile="0.5"}} {s["p50_s"]}')
+        lines.append(f'podcast_rag_stage_seconds{{stage="{stage}",quantile="0.95"}} {s["p95_s"]}')
+        lines.append(f'podcast_rag_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+    lines += ["# HELP podcast_rag_stage_items Items processed per stage (recent window).",
+              "# TYPE podcast_rag_stage_items gauge"]
+    for stage, s in summary.items():
+        for item, v in s["items"].items():
+            lines.append(f'podcast_rag_stage_items{{stage="{stage}",item="{item}"}} {v}')
+    lines += ["# HELP podcast_rag_stage_rss_mb Largest resident set size at the end of a stage.",
+              "# TYPE podcast_rag_stage_rss_mb gauge"]
+    for stage, s in summary.items():
+        lines.append(f'podcast_rag_stage_rss_mb{{stage="{stage}"}} {s["rss_mb"]}')
+    lines += ["# HELP podcast_rag_stage_rss_growth_mb Largest resident set growth during one run of a stage.",
+              "# TYPE podcast_rag_stage_rss_growth_mb gauge"]
+    for stage, s in summary.items():
+        lines.append(f'podcast_rag_stage_rss_growth_mb{{stage="{stage}"}} {s["rss_delta_mb"]}')
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Summarize pipeline stage timings.")
+    ap.add_argument("--prometheus", action="store_true", help="print Prometheus text format")
+    args = ap.parse_args(argv)
+    summary = summarize(read_log())
+    if args.prometheus:
+        print(prometheus_text(summary), end="")
+        return 0
+    for stage, s in summary.items():
+        print(f"{stage:24s} n={s['count']:<5d} p50={s['p50_s']:.3f}s p95={s['p95_s']:.3f}s "
+              f"cpu={s['cpu_mean_s']:.3f}s rss={s['rss_mb']:.0f}MB (+{s['rss_delta_mb']:.0f}) {s['per_second']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
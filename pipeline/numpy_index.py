@@ -0,0 +1,445 @@
+# pipeline/numpy_index.py
+"""
+Exact brute-force vector index on a memory-mapped NumPy matrix.
+
+Drop-in for the subset of the Chroma collection API the pipeline uses
+(upsert / update / delete / query / get / count, same return shapes), without
+Chroma's import and HNSW/sqlite overhead. Rows are L2-normalized, so
+cosine distance is 1 - dot product.
+
+Files under NUMPY_INDEX_PATH (log-structured, so a write costs its own rows):
+    seg-<n>.npy     one segment's L2-normalized rows, float32 (default) or float16
+                    (NUMPY_INDEX_DTYPE), mmapped; float16 halves disk/page cache but is
+                    upcast block by block at query time
+    seg-<n>.json    the segment's ids, documents, metadatas
+    manifest.json   live segments plus each one's deleted row offsets; replaced atomically
+                    and last, so readers only ever see complete segments
+    lock            flock'd by writers, so several processes can share one index
+
+Segments are immutable: upsert appends one and tombstones the rows it overwrites, delete
+only tombstones. Small tail segments are merged (each merge at least doubles the rows
+it rewrites) and everything is compacted once deleted rows outnumber live ones.
+"""
+import os
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from .filters import match, episode_ids, SPEAKER_PREFIX
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within the process
+    fcntl = None
+
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "storage/npindex")
+_BLOCK = 32768  # rows upcast per matmul when the matrix is float16
+
+# filter operators evaluated on whole metadata columns (missing values are NaN / None,
+# which compare False like filters.match does)
+_VEC_OPS = {
+    "$eq": lambda col, a: col == a,
+    "$ne": lambda col, a: col != a,
+    "$gt": lambda col, a: col > a,
+    "$gte": lambda col, a: col >= a,
+    "$lt": lambda col, a: col < a,
+    "$lte": lambda col, a: col <= a,
+    "$in": lambda col, a: np.isin(col, list(a)),
+    "$nin": lambda col, a: ~np.isin(col, list(a)),
+}
+
+
+class NumpyIndex:
+    def __init__(self, path: str = NUMPY_INDEX_PATH, dtype: str | None = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dtype = np.dtype(dtype or os.getenv("NUMPY_INDEX_DTYPE", "float32"))
+        self._lock = threading.RLock()
+        self._segs = {}  # segment id -> parsed segment, reused across reloads
+        self._reset()
+        self._migrate()
+        self._refresh()
+
+    # ---------- storage ----------
+    def _manifest_path(self):
+        return self.path / "manifest.json"
+
+    def _seg_path(self, sid, ext):
+        return self.path / f"seg-{sid}{ext}"
+
+    def _tmp(self, path):
+        return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive write access across threads and processes, on an up-to-date view."""
+        with self._lock, open(self.path / "lock", "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _migrate(self):
+        """Turn a pre-segment index (vectors.npy + rows.json) into segment 0."""
+        rows = self.path / "rows.json"
+        if not rows.exists() or self._manifest_path().exists():
+            return
+        with self._writing():
+            if not rows.exists() or self._manifest_path().exists():
+                return
+            n = len(json.loads(rows.read_text(encoding="utf-8"))["ids"])
+            segments = []
+            if n:
+                os.replace(self.path / "vectors.npy", self._seg_path(0, ".npy"))
+                os.replace(rows, self._seg_path(0, ".json"))
+                segments.append({"id": 0, "rows": n, "deleted": []})
+            self._commit({"next": 1, "segments": segments})
+            for name in ("rows.json", "vectors.npy"):
+                (self.path / name).unlink(missing_ok=True)
+
+    def _reset(self):
+        self._manifest = {"next": 0, "segments": []}
+        self._stamp = None
+        self._ids, self._docs, self._metas = [], [], []
+        self._vecs, self._offsets = [], []
+        self._alive = np.zeros(0, dtype=bool)
+        self._pos = {}
+        self._eids = np.zeros(0, dtype=object)
+        # columns for filter push-down: chunk times and per-speaker seconds (NaN = absent)
+        self._times = {key: np.zeros(0) for key in ("start_time", "end_time")}
+        self._speakers = {}
+
+    def _segment(self, sid):
+        seg = self._segs.get(sid)
+        if seg is None:
+            data = json.loads(self._seg_path(sid, ".json").read_text(encoding="utf-8"))
+            metas = [m or {} for m in data["metadatas"]]
+            seg = {
+                "ids": data["ids"], "docs": data["documents"], "metas": data["metadatas"],
+                "vecs": np.load(self._seg_path(sid, ".npy"), mmap_mode="r")[:len(data["ids"])],
+                "eids": np.asarray([str(m.get("episode_id", "")) for m in metas], dtype=object),
+                "times": {key: np.asarray([m.get(key, np.nan) for m in metas], dtype=np.float64)
+                          for key in ("start_time", "end_time")},
+                "speakers": {},
+            }
+            for i, m in enumerate(metas):
+                for key, secs in m.items():
+                    if key.startswith(SPEAKER_PREFIX):
+                        seg["speakers"].setdefault(key, np.full(len(metas), np.nan))[i] = secs
+            self._segs[sid] = seg
+        return seg
+
+    def _append(self, seg):
+        base, n = len(self._ids), len(seg["ids"])
+        self._offsets.append(base)
+        self._vecs.append(seg["vecs"])
+        self._ids += seg["ids"]
+        self._docs += seg["docs"]
+        self._metas += seg["metas"]
+        self._alive = np.concatenate([self._alive, np.ones(n, dtype=bool)])
+        # a newer segment shadows the id; the older row is tombstoned in the same manifest
+        self._pos.update(zip(seg["ids"], range(base, base + n)))
+        self._eids = np.concatenate([self._eids, seg["eids"]])
+        for key in self._times:
+            self._times[key] = np.concatenate([self._times[key], seg["times"][key]])
+        for key in set(self._speakers) | set(seg["speakers"]):
+            self._speakers[key] = np.concatenate([
+                self._speakers.get(key, np.full(base, np.nan)),
+                seg["speakers"].get(key, np.full(n, np.nan)),
+            ])
+
+    def _load(self):
+        path = self._manifest_path()
+        stamp = _stamp(path)
+        manifest = json.loads(path.read_text(encoding="utf-8")) if stamp else {"next": 0, "segments": []}
+        old = [e["id"] for e in self._manifest["segments"]]
+        new = [e["id"] for e in manifest["segments"]]
+        if new[:len(old)] != old:
+            self._reset()  # segments were merged or dropped; rebuild from the parsed cache
+            old = []
+        for sid in new[len(old):]:
+            self._append(self._segment(sid))
+        self._segs = {sid: self._segs[sid] for sid in new}
+
+        alive = np.ones(len(self._ids), dtype=bool)
+        for off, entry in zip(self._offsets, manifest["segments"]):
+            if entry["deleted"]:
+                alive[off + np.asarray(entry["deleted"], dtype=np.int64)] = False
+        for i in np.flatnonzero(self._alive & ~alive):
+            if self._pos.get(self._ids[i]) == i:
+                del self._pos[self._ids[i]]
+        self._alive = alive
+        self._manifest, self._stamp = manifest, stamp
+
+    def _refresh(self):
+        """Pick up writes made by another process (only their new segments are read)."""
+        if _stamp(self._manifest_path()) == self._stamp:
+            return
+        try:
+            self._load()
+        except FileNotFoundError:
+            # a concurrent merge removed a segment between reading the manifest and the file
+            self._reset()
+            self._load()
+
+    def _commit(self, manifest, drop=()):
+        """Swap in a new manifest, then remove segment files it no longer references."""
+        path = self._manifest_path()
+        tmp = self._tmp(path)
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, path)
+        self._load()
+        for sid in drop:
+            for ext in (".npy", ".json"):
+                self._seg_path(sid, ext).unlink(missing_ok=True)
+
+    def _write_segment(self, sid, ids, docs, metas, vecs):
+        for ext, write in ((".npy", lambda f: np.save(f, np.ascontiguousarray(vecs, dtype=self.dtype))),
+                           (".json", lambda f: f.write(json.dumps(
+                               {"ids": ids, "documents": docs, "metadatas": metas},
+                               ensure_ascii=False).encode("utf-8")))):
+            path = self._seg_path(sid, ext)
+            tmp = self._tmp(path)
+            with open(tmp, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        return {"id": sid, "rows": len(ids), "deleted": []}
+
+    def _tombstone(self, manifest, rows):
+        """Mark global rows deleted in a copy of the current manifest."""
+        for row in rows:
+            s = int(np.searchsorted(self._offsets, row, side="right")) - 1
+            manifest["segments"][s]["deleted"].append(int(row - self._offsets[s]))
+
+    def _copy_manifest(self):
+        return {"next": self._manifest["next"],
+                "segments": [dict(e, deleted=list(e["deleted"])) for e in self._manifest["segments"]]}
+
+    def _merge_from(self):
+        """First segment of the tail to rewrite, or None when the layout is fine."""
+        entries = self._manifest["segments"]
+        live = [e["rows"] - len(e["deleted"]) for e in entries]
+        if sum(live) < len(self._alive) - sum(live):
+            return 0
+        i = len(entries) - 1
+        while i > 0 and live[i - 1] <= sum(live[i:]):
+            i -= 1
+        return i if i < len(entries) - 1 else None
+
+    def _merge(self, start):
+        manifest = self._copy_manifest()
+        off = self._offsets[start] if start < len(self._offsets) else len(self._ids)
+        rows = off + np.flatnonzero(self._alive[off:])
+        dropped = [e["id"] for e in manifest["segments"][start:]]
+        manifest["segments"] = manifest["segments"][:start]
+        if len(rows):
+            sid = manifest["next"]
+            manifest["next"] += 1
+            manifest["segments"].append(self._write_segment(
+                sid, [self._ids[i] for i in rows], [self._docs[i] for i in rows],
+                [self._metas[i] for i in rows], self._gather(rows)))
+        self._commit(manifest, drop=dropped)
+
+    def _gather(self, rows) -> np.ndarray:
+        """float32 copy of the given (sorted) global rows."""
+        parts = []
+        for off, vecs in zip(self._offsets, self._vecs):
+            lo, hi = np.searchsorted(rows, [off, off + len(vecs)])
+            if hi > lo:
+                parts.append(np.asarray(vecs[rows[lo:hi] - off], dtype=np.float32))
+        return np.vstack(parts)
+
+    # ---------- filtering ----------
+    def _mask(self, ids=None, where=None) -> np.ndarray:
+        mask = self._alive.copy()
+        if ids is not None:
+            mask[:] = False
+            mask[[self._pos[c] for c in ids if c in self._pos]] = True
+        if where:
+            fast = self._where_mask(where)
+            if fast is not None:
+                return mask & fast
+            eids = episode_ids(where)
+            if eids is not None:
+                mask &= np.isin(self._eids, [str(e) for e in eids])
+            # anything beyond a plain episode filter is checked row by row on the survivors
+            if eids is None or not _only_episode(where):
+                for i in np.flatnonzero(mask):
+                    if not match(self._metas[i] or {}, where):
+                        mask[i] = False
+        return mask
+
+    def _column(self, key):
+        if key == "episode_id":
+            return self._eids
+        if key in self._times:
+            return self._times[key]
+        if key.startswith(SPEAKER_PREFIX):
+            return self._speakers.get(key, np.full(len(self._ids), np.nan))
+        return None
+
+    def _where_mask(self, where: dict):
+        """Vectorized mask for filters on episode_id, start/end_time and spk_* keys; None if other keys appear."""
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, cond in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._where_mask(c) for c in cond]
+                if not parts or any(p is None for p in parts):
+                    return None
+                mask &= np.logical_and.reduce(parts) if key == "$and" else np.logical_or.reduce(parts)
+                continue
+            col = self._column(key)
+            if col is None:
+                return None
+            for op, arg in (cond if isinstance(cond, dict) else {"$eq": cond}).items():
+                if op not in _VEC_OPS:
+                    return None
+                mask &= np.asarray(_VEC_OPS[op](col, arg), dtype=bool)
+        return mask
+
+    # ---------- collection API ----------
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._pos)
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        emb = np.asarray(embeddings, dtype=np.float32)
+        emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        # a repeated id keeps its last row, like sequential upserts would
+        keep = sorted({cid: j for j, cid in enumerate(ids)}.values())
+        if not keep:
+            return
+        with self._writing():
+            self._append_rows([ids[j] for j in keep], [documents[j] for j in keep],
+                              [metadatas[j] for j in keep], emb[keep])
+
+    def update(self, ids, metadatas=None, documents=None):
+        """Change documents and/or merge metadata of existing rows (vectors are kept), like Chroma."""
+        with self._writing():
+            order = {cid: j for j, cid in enumerate(ids) if cid in self._pos}
+            if not order:
+                return
+            rows = np.array(sorted(self._pos[c] for c in order), dtype=np.int64)
+            new_ids = [self._ids[i] for i in rows]
+            docs = [self._docs[i] if documents is None else documents[order[c]]
+                    for i, c in zip(rows, new_ids)]
+            metas = [self._metas[i] if metadatas is None else {**(self._metas[i] or {}), **metadatas[order[c]]}
+                     for i, c in zip(rows, new_ids)]
+            self._append_rows(new_ids, docs, metas, self._gather(rows))
+
+    def _append_rows(self, ids, docs, metas, vecs):
+        """New segment for these (unique, normalized) rows; rows they overwrite are tombstoned."""
+        manifest = self._copy_manifest()
+        self._tombstone(manifest, sorted(self._pos[c] for c in ids if c in self._pos))
+        sid = manifest["next"]
+        manifest["next"] += 1
+        manifest["segments"].append(self._write_segment(sid, ids, docs, metas, vecs))
+        self._commit(manifest)
+        start = self._merge_from()
+        if start is not None:
+            self._merge(start)
+
+    def delete(self, ids=None, where=None):
+        with self._writing():
+            if ids is None and not where:
+                self._commit({"next": self._manifest["next"], "segments": []},
+                             drop=[e["id"] for e in self._manifest["segments"]])
+                return
+            rows = np.flatnonzero(self._mask(ids, where))
+            if not len(rows):
+                return
+            manifest = self._copy_manifest()
+            self._tombstone(manifest, rows)
+            self._commit(manifest)
+            start = self._merge_from()
+            if start is not None:
+                self._merge(start)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._mask(ids, where))
+            if ids is not None and where is None:
+                # keep the caller's id order, like Chroma
+                rows = [self._pos[c] for c in ids if c in self._pos]
+            rows = list(rows)[int(offset or 0):]
+            if limit is not None:
+                rows = rows[:int(limit)]
+            out = {"ids": [self._ids[i] for i in rows]}
+            if "documents" in include:
+                out["documents"] = [self._docs[i] for i in rows]
+            if "metadatas" in include:
+                out["metadatas"] = [self._metas[i] for i in rows]
+            return out
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        q /= np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self._refresh()
+            out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            if not self._pos:
+                for key in out:
+                    out[key] = [[] for _ in q]
+                return out
+
+            dead = len(self._pos) < len(self._ids)
+            rows = np.flatnonzero(self._mask(where=where)) if where or dead else None
+            sims = self._scores(q, rows)
+            k = min(int(n_results), sims.shape[1])
+            for s in sims:
+                top = np.argpartition(-s, k - 1)[:k] if k < len(s) else np.arange(len(s))
+                top = top[np.argsort(-s[top], kind="stable")]
+                idx = rows[top] if rows is not None else top
+                out["ids"].append([self._ids[i] for i in idx])
+                out["documents"].append([self._docs[i] for i in idx])
+                out["metadatas"].append([self._metas[i] for i in idx])
+                out["distances"].append((1.0 - s[top]).tolist())
+            return out
+
+    def _scores(self, q: np.ndarray, rows=None) -> np.ndarray:
+        """Cosine similarities (n_queries x n_rows) against all rows or the selected (sorted) ones."""
+        parts = []
+        for off, vecs in zip(self._offsets, self._vecs):
+            if rows is not None:
+                lo, hi = np.searchsorted(rows, [off, off + len(vecs)])
+                if hi == lo:
+                    continue
+                vecs = vecs[rows[lo:hi] - off]
+            parts.append(_matmul(q, vecs))
+        return np.hstack(parts) if parts else np.empty((len(q), 0), dtype=np.float32)
+
+
+def _matmul(q: np.ndarray, mat) -> np.ndarray:
+    if mat.dtype == np.float32:
+        return q @ np.asarray(mat).T
+    # float16 has no BLAS path; upcast in blocks to bound the temporary
+    sims = np.empty((len(q), len(mat)), dtype=np.float32)
+    for i in range(0, len(mat), _BLOCK):
+        sims[:, i:i + _BLOCK] = q @ np.asarray(mat[i:i + _BLOCK], dtype=np.float32).T
+    return sims
+
+
+def _stamp(path: Path):
+    """Identity of the current manifest file (os.replace always gives a new inode)."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _only_episode(where: dict) -> bool:
+    """True if the filter is nothing but an episode_id equality/$in (fully handled by the mask)."""
+    if list(where) != ["episode_id"]:
+        return False
+    cond = where["episode_id"]
+    return not isinstance(cond, dict) or set(cond) <= {"$eq", "$in"} and len(cond) == 1
@@ -0,0 +1,153 @@
+# pipeline/rerank.py
+"""
+CrossEncoder reranking: batched, truncated, cached, and skipped when the
+first-stage ranking is already decisive.
+
+Backends (RERANK_BACKEND): torch (default), torch-int8 (dynamic int8 Linear
+layers on CPU), onnx (sentence-transformers versions whose CrossEncoder takes
+`backend=`).
+"""
+import os
+import inspect
+import threading
+
+import numpy as np
+
+from .lru import TTLCache
+from .metrics import span
+
+DEFAULT_CROSS_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_RERANKERS = {}
+_RERANKERS_LOCK = threading.Lock()
+
+
+def _load_cross(model_name: str, backend: str, max_length: int):
+    from sentence_transformers import CrossEncoder
+
+    if backend in ("torch", "torch-int8"):
+        cross = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        if backend == "torch-int8":
+            import torch
+            cross.model = torch.quantization.quantize_dynamic(cross.model, {torch.nn.Linear}, dtype=torch.qint8)
+        return cross
+    if backend == "onnx":
+        if "backend" not in inspect.signature(CrossEncoder.__init__).parameters:
+            raise RuntimeError("RERANK_BACKEND=onnx needs a sentence-transformers CrossEncoder with ONNX support")
+        return CrossEncoder(model_name, max_length=max_length, device="cpu", backend="onnx")
+    raise ValueError(f"Unknown rerank backend: {backend}")
+
+
+class Reranker:
+    def __init__(self, model_name: str = DEFAULT_CROSS_MODEL, batch_size: int | None = None,
+                 max_length: int | None = None, backend: str | None = None):
+        self.model_name = model_name
+        self.batch_size = int(batch_size or os.getenv("RERANK_BATCH_SIZE", "32"))
+        # chunks are ~420 tokens, so the 512 default scores the whole window
+        self.max_length = int(max_length or os.getenv("RERANK_MAX_LENGTH", "512"))
+        self.backend = (backend or os.getenv("RERANK_BACKEND", "torch")).lower()
+        self._model = None
+        self._lock = threading.Lock()
+        self._scores = TTLCache(maxsize=int(os.getenv("RERANK_CACHE_SIZE", "20000")),
+                                ttl=float(os.getenv("RERANK_CACHE_TTL", "3600")))
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = _load_cross(self.model_name, self.backend, self.max_length)
+        return self._model
+
+    def score_pairs(self, items, version=None) -> list:
+        """
+        items: [(query, chunk_id, text)]. Returns one score per item. Every uncached
+        pair goes through a single batched predict; (query, chunk_id, version) scores
+        are remembered, so the version must change whenever chunk texts can.
+        """
+        scores = [None] * len(items)
+        todo = []
+        for i, (q, cid, _) in enumerate(items):
+            s = self._scores.get((q, cid, version))
+            if s is None:
+                todo.append(i)
+            else:
+                scores[i] = s
+        if todo:
+            pairs = [[items[i][0], items[i][2]] for i in todo]
+            with span("rerank") as sp:
+                fresh = np.asarray(self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False))
+                sp.add(pairs=len(pairs))
+            for i, s in zip(todo, fresh.tolist()):
+                scores[i] = s
+                self._scores.put((items[i][0], items[i][1], version), s)
+        return scores
+
+    def stats(self) -> dict:
+        return self._scores.stats()
+
+
+def get_reranker(model_name: str = DEFAULT_CROSS_MODEL) -> Reranker:
+    with _RERANKERS_LOCK:
+        r = _RERANKERS.get(model_name)
+        if r is None:
+            r = _RERANKERS[model_name] = Reranker(model_name)
+    return r
+
+
+def is_ambiguous(first_scores, out_k: int, gap: float | None = None) -> bool:
+    """
+    Whether the first-stage ranking is too close to call around the out_k cut.
+    The gaps at the top and at the cut are compared to the spread of the candidate scores;
+    if both are large the CrossEncoder would not change which hits are returned first.
+    """
+    gap = float(gap if gap is not None else os.getenv("RERANK_GAP", "0.15"))
+    s = np.asarray(first_scores, dtype=np.float64)
+    if gap >= 1:
+        return True
+    if len(s) < 2:
+        return False
+    spread = s[0] - s[-1]
+    if spread <= 0:
+        return True
+    gaps = -np.diff(s) / spread
+    if gaps[0] < gap:
+        return True
+    # with out_k >= len(s) every candidate is returned, so only the top order matters
+    return bool(out_k < len(s) and gaps[out_k - 1] < gap)
+
+
+def cascade(query: str, hits, first_scores, out_k: int, reranker: Reranker,
+            top_n: int | None = None, version=None, force: bool = False):
+    """
+    Two-stage rerank: cross-score only the top_n first-stage candidates, and only
+    when the first-stage order is ambiguous (or `force`). Returns hits reordered.
+    """
+    return cascade_many([(query, hits, first_scores, out_k)], reranker, top_n, version, force)[0]
+
+
+def cascade_many(items, reranker: Reranker, top_n: int | None = None, version=None, force: bool = False) -> list:
+    """
+    cascade() for many (query, hits, first_scores, out_k) at once: the pairs of every
+    ambiguous query are scored in the same CrossEncoder batches. Hit lists come back in input order.
+    """
+    top_n = int(top_n or os.getenv("RERANK_TOP_N", "0"))
+    heads, pairs = [], []
+    for query, hits, first, out_k in items:
+        n = top_n or max(2 * out_k, 10)
+        if hits and (force or is_ambiguous(first[:n], out_k)):
+            heads.append((len(pairs), n))
+            pairs.extend((query, h[0], h[1]) for h in hits[:n])
+        else:
+            heads.append(None)
+    scores = reranker.score_pairs(pairs, version=version) if pairs else []
+
+    out = []
+    for (query, hits, _, _), head in zip(items, heads):
+        if head is None:
+            out.append(hits)
+            continue
+        at, n = head
+        ranked = sorted(zip(scores[at:at + len(hits[:n])], hits[:n]), key=lambda x: -x[0])
+        out.append([h for _, h in ranked] + hits[n:])
+    return out
@@ -12,61 +12,257 @@ try:
 except Exception:
     pass
 
-from .embed_index import get_chroma
+import json
+import math
 
-_EMBEDDER = None
-_CROSS = None
+from .embed_index import get_index, index_version, live_versions, is_live, backfill_speaker_keys
+from .embedder import get_embedding_service
+from .lexical import get_lexical_index, rrf_fuse
+from .filters import match, episode_ids, speakers, build_where
+from .lru import TTLCache
+from .metrics import span
+from .rerank import DEFAULT_CROSS_MODEL, get_reranker, cascade_many
 
-def _get_embedder(model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-    global _EMBEDDER
-    if _EMBEDDER is None:
-        from sentence_transformers import SentenceTransformer
-        _EMBEDDER = SentenceTransformer(model_name)
-    return _EMBEDDER
+# Query embeddings don't depend on the index; result lists are keyed by the index version,
+# so any upsert/delete makes older entries unreachable
+_QUERY_VECS = TTLCache(maxsize=int(os.getenv("QUERY_CACHE_SIZE", "2048")), ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")))
+_RESULTS = TTLCache(maxsize=int(os.getenv("RESULT_CACHE_SIZE", "512")), ttl=float(os.getenv("RESULT_CACHE_TTL", "600")))
+_RESULTS_VERSION = None
 
-def _get_cross(model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
-    global _CROSS
-    if _CROSS is None:
-        from sentence_transformers import CrossEncoder
-        _CROSS = CrossEncoder(model_name)
-    return _CROSS
+# models whose tokenizers lower-case anyway; case can only be folded when every model
+# that sees the query is one of these (BM25 is always uncased)
+UNCASED_MODELS = {"sentence-transformers/all-MiniLM-L6-v2", DEFAULT_CROSS_MODEL}
+
+def normalize_query(query: str, fold_case: bool = False) -> str:
+    query = " ".join(query.split())
+    return query.lower() if fold_case else query
+
+def _copy_hits(hits) -> list:
+    """Hits with their own meta dicts, so callers can't mutate cached results."""
+    return [(cid, doc, dict(meta or {})) for cid, doc, meta in hits]
+
+def cache_stats() -> dict:
+    return {"query_vectors": _QUERY_VECS.stats(), "results": _RESULTS.stats(),
+            "rerank_scores": get_reranker().stats()}
+
+def dedupe_overlapping(hits, scores, max_overlap: float = 0.3):
+    """
+    Greedy interval suppression in rank order (MMR with a hard time-overlap penalty):
+    a hit is dropped when it shares more than `max_overlap` of the shorter window with
+    a better-ranked hit from the same episode. Returns the kept (hits, scores).
+    """
+    kept, kept_scores, spans = [], [], {}
+    for h, sc in zip(hits, scores):
+        meta = h[2] or {}
+        a, b = float(meta.get("start_time", 0.0)), float(meta.get("end_time", 0.0))
+        seen = spans.setdefault(meta.get("episode_id"), [])
+        if any(min(b, y) - max(a, x) > max(max_overlap * min(b - a, y - x), 0.0) for x, y in seen):
+            continue
+        seen.append((a, b))
+        kept.append(h)
+        kept_scores.append(sc)
+    return kept, kept_scores
 
 class Retriever:
     def __init__(
         self,
         embed_model: str = "sentence-transformers/all-MiniLM-L6-v2",
-        rerank: bool = False,
-        cross_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        rerank: bool = True,
+        cross_model: str = DEFAULT_CROSS_MODEL,
+        hybrid: bool | None = None,
+        dedupe: bool | None = None,
     ):
         self.embed_model = embed_model
         self.rerank = rerank
         self.cross_model = cross_model
-        self.coll = get_chroma()
+        self.hybrid = hybrid if hybrid is not None else os.getenv("RETRIEVE_HYBRID", "1") != "0"
+        self.dedupe = dedupe if dedupe is not None else os.getenv("RETRIEVE_DEDUPE", "1") != "0"
+        # above the chunker's 0.2 window overlap, so plain neighbouring windows both survive
+        self.max_overlap = float(os.getenv("DEDUPE_OVERLAP", "0.3"))
+        self.overfetch = float(os.getenv("RETRIEVE_OVERFETCH", "0.5"))
+        try:
+            # chunks indexed before speaker filters existed: add their spk_* keys once
+            backfill_speaker_keys()
+        except Exception as e:
+            print(f"[speaker key backfill skipped] {e}")
+        self.lexical = get_lexical_index() if self.hybrid else None
+        if self.lexical is not None:
+            try:
+                # indexes built before the lexical store existed: backfill once
+                if self.lexical.count() == 0 and int(self.coll.count()) > 0:
+                    self.lexical.rebuild_from(self.coll)
+            except Exception as e:
+                print(f"[lexical backfill skipped] {e}")
+
+    @property
+    def coll(self):
+        # looked up per use: the Chroma handle is reopened after another process writes
+        return get_index()
+
+    def _lexical_hits(self, query: str, k: int, filters: dict | None, known: dict) -> list:
+        """BM25 candidates; docs/metas not already in `known` are fetched from the collection."""
+        return self._lexical_hits_many([query], k, filters, known)[0]
+
+    def _lexical_hits_many(self, queries, k: int, filters: dict | None, known: dict) -> list:
+        ids, spk = episode_ids(filters), speakers(filters)
+        ranked = [[cid for cid, _ in self.lexical.search(q, k, ids, spk)] for q in queries]
+        missing = list(dict.fromkeys(cid for r in ranked for cid in r if cid not in known))
+        if missing:
+            # one round-trip for every query's missing chunks
+            got = self.coll.get(ids=missing, include=["documents", "metadatas"])
+            for cid, doc, meta in zip(got.get("ids") or [], got.get("documents") or [], got.get("metadatas") or []):
+                # filters the lexical store could not push down are applied here
+                if match(meta or {}, filters):
+                    known[cid] = (cid, doc, meta)
+        return [[cid for cid in r if cid in known] for r in ranked]
+
+    def _cache_key(self, version, query: str, filters: dict | None, k: int, out_k: int):
+        return (version, query, json.dumps(filters or {}, sort_keys=True), k, out_k,
+                self.rerank, self.hybrid, self.dedupe, self.embed_model, self.cross_model)
+
+    def _current_version(self):
+        global _RESULTS_VERSION
+        version = index_version()
+        if version != _RESULTS_VERSION:
+            _RESULTS.clear()
+            _RESULTS_VERSION = version
+        return version
+
+    def search(self, query: str, k: int = 15, out_k: int = 6, filters: dict | None = None,
+               speaker=None, time_range=None):
+        """
+        Dense (+ BM25) candidates, then the CrossEncoder cascade when rerank is on:
+        only the top RERANK_TOP_N candidates are cross-scored, and only if the
+        first-stage scores are too close to trust around the cut.
+        `speaker` (label or list) and `time_range` ((start, end) seconds) are added to
+        `filters` and pushed down to the vector and BM25 stores.
+        """
+        return self.search_many([query], k=k, out_k=out_k, filters=filters,
+                                speaker=speaker, time_range=time_range)[0]
+
+    def search_many(self, queries, k: int = 15, out_k: int = 6, filters=None,
+                    speaker=None, time_range=None) -> list:
+        """
+        search() for many queries: one embedding batch, one collection query per distinct
+        filter, shared CrossEncoder batches. `filters` is one filter for all queries or a
+        list with one per query. Returns one hit list per query, in input order.
+        """
+        if speaker or time_range:
+            if isinstance(filters, list):
+                filters = [build_where(f, speaker, time_range) for f in filters]
+            else:
+                filters = build_where(filters, speaker, time_range)
+        with span("search") as s:
+            out = self._search_many(queries, k, out_k, filters)
+            s.add(queries=len(out))
+        return out
+
+    def _search_many(self, queries, k: int, out_k: int, filters) -> list:
+        fold = self.embed_model in UNCASED_MODELS and (not self.rerank or self.cross_model in UNCASED_MODELS)
+        queries = [normalize_query(q, fold) for q in queries]
+        per_filter = filters if isinstance(filters, list) else [filters] * len(queries)
+        if len(per_filter) != len(queries):
+            raise ValueError("filters must be a dict/None or a list with one entry per query")
+        version = self._current_version()
+
+        out = [None] * len(queries)
+        groups = {}  # filter json -> {query: [positions]}
+        for i, (q, f) in enumerate(zip(queries, per_filter)):
+            cached = _RESULTS.get(self._cache_key(version, q, f, k, out_k))
+            if cached is not None:
+                out[i] = _copy_hits(cached)
+            else:
+                groups.setdefault(json.dumps(f or {}, sort_keys=True), {}).setdefault(q, []).append(i)
+        if not groups:
+            return out
+
+        self._query_vectors(list(dict.fromkeys(q for g in groups.values() for q in g)))
+        for fkey, by_query in groups.items():
+            f = json.loads(fkey) or None
+            qs = list(by_query)
+            for q, hits in zip(qs, self._search(qs, k, out_k, f, version)):
+                _RESULTS.put(self._cache_key(version, q, f, k, out_k), tuple(_copy_hits(hits)))
+                for i in by_query[q]:
+                    out[i] = _copy_hits(hits)
+        return out
+
+    def _query_vectors(self, queries) -> list:
+        """Query embeddings, encoding every uncached query in one batch."""
+        found = {q: _QUERY_VECS.get((self.embed_model, q)) for q in queries}
+        missing = [q for q, v in found.items() if v is None]
+        if missing:
+            vecs = get_embedding_service(self.embed_model).encode(missing)
+            for q, v in zip(missing, vecs):
+                found[q] = v.tolist()
+                _QUERY_VECS.put((self.embed_model, q), found[q])
+        return [found[q] for q in queries]
+
+    def _candidates(self, queries, qv, n: int, filters: dict | None, live: dict) -> list:
+        """
+        First-stage (dense, fused with BM25 when hybrid) [(hits, scores, dropped, raw)] per query,
+        best first. Chunks of staged or superseded episode versions are dropped (and counted);
+        raw is how many dense results came back, so fewer than n means the scope is exhausted.
+        """
+        res = self.coll.query(query_embeddings=qv, n_results=n, where=filters or {})
+        out = []
+        for i in range(len(queries)):
+            ids = res.get("ids", [])[i] if res else []
+            docs = res.get("documents", [])[i] if res else []
+            metas = res.get("metadatas", [])[i] if res else []
+            dists = (res.get("distances") or [[]] * len(queries))[i] if res else []
+            hits = list(zip(ids, docs, metas))
+            first = [-float(d) for d in dists] if len(dists) == len(hits) else [-float(r) for r in range(len(hits))]
+            out.append((hits, first))
+        raw = [len(hits) for hits, _ in out]
+
+        if self.hybrid:
+            # fuse dense and BM25 rankings (reciprocal-rank fusion)
+            known = {h[0]: h for hits, _ in out for h in hits}
+            lexical = self._lexical_hits_many(queries, n, filters, known)
+            for i, ((hits, _), lex) in enumerate(zip(out, lexical)):
+                fused = rrf_fuse([[h[0] for h in hits], lex])[:n]
+                out[i] = ([known[cid] for cid, _ in fused], [score for _, score in fused])
+
+        for i, (hits, first) in enumerate(out):
+            keep = [j for j, h in enumerate(hits) if is_live(h[2], live)]
+            out[i] = ([hits[j] for j in keep], [first[j] for j in keep], len(hits) - len(keep), raw[i])
+        return out
 
-    def search(self, query: str, k: int = 15, out_k: int = 6, filters: dict | None = None):
+    def _search(self, queries, k: int, out_k: int, filters: dict | None, version=None) -> list:
         try:
             total = int(self.coll.count())
         except Exception:
             total = 0
         if total <= 0:
-            return []
+            return [[] for _ in queries]
 
         k = max(1, min(k, total))
         out_k = max(1, min(out_k, k))
 
-        embedder = _get_embedder(self.embed_model)
-        qv = embedder.encode([query], normalize_embeddings=True, show_progress_bar=False).tolist()
+        qv = self._query_vectors(queries)
 
-        res = self.coll.query(query_embeddings=qv, n_results=k, where=filters or {})
-        ids = res.get("ids", [[]])[0] if res else []
-        docs = res.get("documents", [[]])[0] if res else []
-        metas = res.get("metadatas", [[]])[0] if res else []
-        hits = list(zip(ids, docs, metas))
+        # overlapping windows collapse to one moment (and mid-swap episodes hide a version),
+        # so fetch extra candidates up front and double the fetch for queries still short
+        # of out_k distinct live hits, until the (filtered) scope has nothing more to give
+        live = live_versions()
+        fetch = min(total, k + math.ceil(k * self.overfetch)) if self.dedupe else k
+        all_hits, all_first = [None] * len(queries), [None] * len(queries)
+        todo = list(range(len(queries)))
+        while todo:
+            got = self._candidates([queries[i] for i in todo], [qv[i] for i in todo], fetch, filters, live)
+            retry = []
+            for i, (hits, first, dropped, raw) in zip(todo, got):
+                n_before = len(hits)
+                if self.dedupe:
+                    hits, first = dedupe_overlapping(hits, first, self.max_overlap)
+                if (dropped or len(hits) < n_before) and len(hits) < out_k and raw >= fetch and fetch < total:
+                    retry.append(i)
+                all_hits[i], all_first[i] = hits[:k], first[:k]
+            todo, fetch = retry, min(total, fetch * 2)
 
-        if self.rerank and hits:
-            cross = _get_cross(self.cross_model)
-            pairs = [[query, d] for _, d, _ in hits]
-            scores = cross.predict(pairs).tolist()
-            hits = [h for _, h in sorted(zip(scores, hits), key=lambda x: -x[0])]
+        # rerank only the surviving (distinct) candidates
+        if self.rerank:
+            all_hits = cascade_many([(q, hits, first, out_k) for q, hits, first in zip(queries, all_hits, all_first)],
+                                    get_reranker(self.cross_model), version=version)
 
-        return hits[:out_k]
+        return [hits[:out_k] for hits in all_hits]
@@ -0,0 +1,114 @@
+# pipeline/startup.py
+"""
+Background warm-up of the search path, so the first query doesn't pay for
+model loads and store connections.
+
+start_warmup() runs once per process on a daemon thread:
+    index     vector store handle + count (Chroma import/open, or mmap the NumPy matrix)
+    lexical   BM25 store connection
+    embedder  load the SentenceTransformer and encode one string
+    reranker  load the CrossEncoder and score one pair (WARMUP_RERANK=0 skips it)
+
+readiness() reports each step's state ("pending" / "loading" / "ready" /
+"failed" / "skipped"), its seconds and any error. Ingest-only modules
+(faster-whisper, ffmpeg, pyannote) are never touched here.
+"""
+import os
+import time
+import threading
+
+from .embedder import DEFAULT_MODEL
+from .rerank import DEFAULT_CROSS_MODEL
+
+STEPS = ("index", "lexical", "embedder", "reranker")
+
+_STATE = {name: {"state": "pending", "secs": None, "error": None} for name in STEPS}
+_LOCK = threading.Lock()
+_THREAD = None
+_DONE = threading.Event()
+
+
+def _set(name, **fields):
+    with _LOCK:
+        _STATE[name].update(fields)
+
+
+def _step(name, fn):
+    _set(name, state="loading")
+    t0 = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        _set(name, state="failed", secs=round(time.perf_counter() - t0, 3), error=f"{type(e).__name__}: {e}")
+        print(f"[warmup {name} failed] {e}")
+        return
+    _set(name, state="ready", secs=round(time.perf_counter() - t0, 3))
+
+
+def _warm_index():
+    from .embed_index import get_index
+    get_index().count()
+
+
+def _warm_lexical():
+    from .lexical import get_lexical_index
+    get_lexical_index().count()
+
+
+def _run(embed_model: str, cross_model: str, rerank: bool):
+    try:
+        _step("index", _warm_index)
+        _step("lexical", _warm_lexical)
+
+        def embedder():
+            from .embedder import get_embedding_service
+            get_embedding_service(embed_model).encode(["warm up"])
+        _step("embedder", embedder)
+
+        if rerank:
+            def reranker():
+                from .rerank import get_reranker
+                get_reranker(cross_model).model.predict([["warm up", "warm up"]], show_progress_bar=False)
+            _step("reranker", reranker)
+        else:
+            _set("reranker", state="skipped")
+    finally:
+        _DONE.set()
+
+
+def start_warmup(embed_model: str = DEFAULT_MODEL, cross_model: str = DEFAULT_CROSS_MODEL,
+                 rerank: bool | None = None) -> bool:
+    """
+    Start the warm-up thread unless it already ran. With WARMUP=0 every step is
+    marked skipped instead (models then load on first use). Returns True if started.
+    """
+    global _THREAD
+    if os.getenv("WARMUP", "1") == "0":
+        with _LOCK:
+            for step in _STATE.values():
+                if step["state"] == "pending":
+                    step["state"] = "skipped"
+        _DONE.set()
+        return False
+    if rerank is None:
+        rerank = os.getenv("WARMUP_RERANK", "1") != "0"
+    with _LOCK:
+        if _THREAD is not None:
+            return False
+        _THREAD = threading.Thread(target=_run, args=(embed_model, cross_model, rerank),
+                                   name="warmup", daemon=True)
+        _THREAD.start()
+    return True
+
+
+def readiness() -> dict:
+    """{"ready": bool, "done": bool, "steps": {name: {"state", "secs", "error"}}}."""
+    with _LOCK:
+        steps = {k: dict(v) for k, v in _STATE.items()}
+    ready = all(s["state"] in ("ready", "skipped") for s in steps.values())
+    return {"ready": ready, "done": _DONE.is_set(), "steps": steps}
+
+
+def wait_ready(timeout: float | None = None) -> bool:
+    """Block until warm-up finished (successfully or not); False on timeout."""
+    return _DONE.wait(timeout)
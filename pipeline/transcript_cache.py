@@ -0,0 +1,47 @@
+# pipeline/transcript_cache.py
+"""
+Content-addressed transcript cache.
+
+Key = sha256 of the audio bytes + a fingerprint of everything that changes the
+transcript (Whisper model, beam size, VAD, diarization model). Entries use the
+columnar transcript format, so re-uploading the same master is a file copy
+instead of ffmpeg + Whisper + pyannote.
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+
+from .transcript_store import EXT, write_transcript
+
+CACHE_DIR = Path(os.getenv("TRANSCRIPT_CACHE_DIR", "storage/cache/transcripts"))
+
+
+def audio_digest(path, block_size: int = 1 << 20) -> str:
+    """sha256 of the file contents, streamed."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def config_fingerprint(**settings) -> str:
+    """Stable short hash of the transcription/diarization settings."""
+    blob = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def _path(digest: str, fingerprint: str) -> Path:
+    return CACHE_DIR / f"{digest}-{fingerprint}{EXT}"
+
+
+def load(digest: str, fingerprint: str) -> Path | None:
+    """Path of the cached columnar transcript (words, turns, language), or None."""
+    p = _path(digest, fingerprint)
+    return p if p.exists() else None
+
+
+def store(digest: str, fingerprint: str, words, turns: list, language: str) -> Path:
+    # write_transcript writes to a temp file and renames, so readers never see a torn entry
+    return write_transcript(_path(digest, fingerprint), words, turns, language=language)
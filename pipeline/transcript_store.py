@@ -0,0 +1,142 @@
+# pipeline/transcript_store.py
+"""
+Columnar episode transcripts (Arrow IPC file, uncompressed so it can be memory-mapped).
+
+One row per word:
+    start   float64 (seconds; float32 can't hold 1 ms steps past ~4.6 h)
+    end     float64
+    speaker int16   -> index into the "speakers" label list
+    text    string  (Arrow keeps this as one offsets table + one UTF-8 buffer)
+
+Episode-level fields (id, title, language, turns, ...) live in the schema metadata.
+"""
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+SCHEMA = pa.schema([
+    ("start", pa.float64()),
+    ("end", pa.float64()),
+    ("speaker", pa.int16()),
+    ("text", pa.string()),
+])
+
+EXT = ".arrow"
+
+
+class EpisodeTranscript:
+    """Read-only view over one episode's word columns; no per-word dicts are built."""
+
+    def __init__(self, table: pa.Table, source=None):
+        self._table = table
+        self._source = source  # keeps the memory map alive
+        meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+        self.episode_id = meta.get("episode_id", "")
+        self.episode_title = meta.get("episode_title", "")
+        self.audio_path = meta.get("audio_path", "")
+        self.language = meta.get("language", "en")
+        self.turns = json.loads(meta.get("turns", "[]"))
+        self.speaker_labels = json.loads(meta.get("speakers", "[]"))
+
+    def __len__(self):
+        return self._table.num_rows
+
+    def _col(self, name):
+        return self._table.column(name).combine_chunks()
+
+    @property
+    def start(self) -> np.ndarray:
+        return self._col("start").to_numpy(zero_copy_only=False)
+
+    @property
+    def end(self) -> np.ndarray:
+        return self._col("end").to_numpy(zero_copy_only=False)
+
+    @property
+    def speaker_codes(self) -> np.ndarray:
+        return self._col("speaker").to_numpy(zero_copy_only=False)
+
+    @property
+    def texts(self) -> pa.StringArray:
+        return self._col("text")
+
+    def words(self):
+        """Legacy dict-per-word iterator (only for callers that still need it)."""
+        labels = self.speaker_labels
+        starts = self.start.astype(np.float64).round(3).tolist()
+        ends = self.end.astype(np.float64).round(3).tolist()
+        for s, e, c, t in zip(starts, ends,
+                              self.speaker_codes.tolist(), self.texts.to_pylist()):
+            yield {"text": t, "start": s, "end": e, "speaker": labels[c]}
+
+
+def _metadata(turns, speakers, **meta) -> dict:
+    out = {k: str(v) for k, v in meta.items() if v is not None}
+    out["turns"] = json.dumps(turns, ensure_ascii=False)
+    out["speakers"] = json.dumps(speakers, ensure_ascii=False)
+    return out
+
+
+def _table_from_words(words, turns, **meta) -> pa.Table:
+    from .align import assign_speaker_codes
+
+    starts, ends, texts = [], [], []
+    for w in words:
+        starts.append(w["start"]); ends.append(w["end"]); texts.append(w["text"])
+    start = np.asarray(starts, dtype=np.float64)
+    end = np.asarray(ends, dtype=np.float64)
+    codes, labels = assign_speaker_codes(np.asarray(starts, dtype=np.float64), turns)
+    table = pa.Table.from_arrays(
+        [pa.array(start), pa.array(end), pa.array(codes.astype(np.int16)), pa.array(texts, pa.string())],
+        schema=SCHEMA,
+    )
+    return table.replace_schema_metadata(_metadata(turns, labels, **meta))
+
+
+def _write_table(table: pa.Table, path: Path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def write_transcript(path, words, turns, **meta) -> Path:
+    """Write word dicts (any iterable) + turns as one columnar file. Extra kwargs go to metadata."""
+    _write_table(_table_from_words(words, turns, **meta), path)
+    return Path(path)
+
+
+def copy_transcript(src, dst, **meta) -> Path:
+    """Copy a transcript file, overriding metadata fields (e.g. a new title)."""
+    tr = read_transcript(src)
+    current = {k.decode(): v.decode() for k, v in (tr._table.schema.metadata or {}).items()}
+    current.update({k: str(v) for k, v in meta.items() if v is not None})
+    _write_table(tr._table.replace_schema_metadata(current), dst)
+    return Path(dst)
+
+
+def read_transcript(path) -> EpisodeTranscript:
+    """Memory-map a transcript file; columns are paged in only when touched."""
+    source = pa.memory_map(str(path), "r")
+    table = pa.ipc.open_file(source).read_all()
+    return EpisodeTranscript(table, source)
+
+
+def load_episode(path) -> EpisodeTranscript:
+    """Columnar file, or a legacy episode JSON converted in memory."""
+    path = Path(path)
+    if path.suffix != ".json":
+        return read_transcript(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    table = _table_from_words(
+        data.get("words", []), data.get("turns", []),
+        episode_id=data.get("episode_id"), episode_title=data.get("episode_title"),
+        audio_path=data.get("audio_path"), language=data.get("language"),
+    )
+    return EpisodeTranscript(table)
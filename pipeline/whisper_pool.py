@@ -0,0 +1,128 @@
+# pipeline/whisper_pool.py
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class WhisperPool:
+    """
+    Up to `size` loaded WhisperModel instances for one (model_size, device, compute_type).
+    Models are loaded lazily on first use and then reused by every caller in the process.
+    """
+
+    def __init__(self, model_size: str, device: str = "cpu", compute_type: str = "auto",
+                 size: int = 1, cpu_threads: int = 0, num_workers: int = 1):
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.size = max(1, int(size))
+        self.cpu_threads = int(cpu_threads)
+        self.num_workers = max(1, int(num_workers))
+        self._idle = queue.Queue()
+        self._loaded = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "loads": 0, "load_secs": 0.0,
+            "decodes": 0, "decode_secs": 0.0, "audio_secs": 0.0,
+        }
+
+    def _load(self):
+        from faster_whisper import WhisperModel
+
+        t0 = time.perf_counter()
+        model = WhisperModel(
+            self.model_size,
+            device=self.device,
+            compute_type=self.compute_type,
+            cpu_threads=self.cpu_threads,
+            num_workers=self.num_workers,
+        )
+        with self._lock:
+            self._stats["loads"] += 1
+            self._stats["load_secs"] += time.perf_counter() - t0
+        return model
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a model; loads a new instance only while fewer than `size` exist."""
+        try:
+            model = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_load = self._loaded < self.size
+                if can_load:
+                    self._loaded += 1
+            if can_load:
+                try:
+                    model = self._load()
+                except Exception:
+                    with self._lock:
+                        self._loaded -= 1
+                    raise
+            else:
+                model = self._idle.get()
+        try:
+            yield model
+        finally:
+            self._idle.put(model)
+
+    def transcribe(self, audio, **kwargs):
+        """Run model.transcribe and fully consume its segment generator. Returns (segments, info)."""
+        with self.acquire() as model:
+            t0 = time.perf_counter()
+            segments, info = model.transcribe(audio, **kwargs)
+            segments = list(segments)
+            elapsed = time.perf_counter() - t0
+        with self._lock:
+            self._stats["decodes"] += 1
+            self._stats["decode_secs"] += elapsed
+            self._stats["audio_secs"] += float(getattr(info, "duration", 0.0) or 0.0)
+        return segments, info
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["loaded"] = self._loaded
+        out.update(model_size=self.model_size, device=self.device,
+                   compute_type=self.compute_type, size=self.size)
+        return out
+
+
+def get_whisper_pool(model_size: str | None = None, device: str | None = None,
+                     compute_type: str | None = None, size: int | None = None,
+                     cpu_threads: int | None = None, num_workers: int | None = None) -> WhisperPool:
+    """Process-wide pool registry keyed by (model_size, device, compute_type)."""
+    device = (device or os.getenv("WHISPER_DEVICE") or "cpu").lower()
+    model_size = model_size or os.getenv("WHISPER_MODEL", "medium")
+    compute_type = compute_type or os.getenv("WHISPER_COMPUTE_TYPE", "auto")
+    size = int(size or os.getenv("WHISPER_POOL_SIZE", "1"))
+
+    # If CPU, tell CTranslate2 to not even try CUDA
+    if device == "cpu":
+        os.environ["CT2_FORCE_CPU"] = "1"
+
+    key = (model_size, device, compute_type)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = WhisperPool(
+                model_size, device=device, compute_type=compute_type, size=size,
+                cpu_threads=int(cpu_threads if cpu_threads is not None else os.getenv("WHISPER_CPU_THREADS", "0")),
+                num_workers=int(num_workers if num_workers is not None else os.getenv("WHISPER_NUM_WORKERS", "1")),
+            )
+            _POOLS[key] = pool
+        elif size > pool.size:
+            pool.size = size
+    return pool
+
+
+def whisper_stats() -> list[dict]:
+    """Load vs decode timings for every pool created in this process."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return [p.stats() for p in pools]
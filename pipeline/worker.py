@@ -0,0 +1,215 @@
+# pipeline/worker.py
+"""
+Ingestion worker: takes jobs from pipeline.jobs and runs the batch stages
+(transcribe -> chunk -> index) outside the Streamlit process. Several queued
+uploads are prepared in parallel through batch.ingest_many; delete and wipe
+jobs run in queue order between them.
+
+Only one writer serves a storage directory at a time (a lease in the jobs
+database, also taken by the batch CLI), since the vector store has a single writer.
+
+CLI:
+    python -m pipeline.worker              # serve until stopped
+    python -m pipeline.worker --once       # drain the queue, then exit
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+
+from .jobs import get_job_queue
+
+# progress shown when each stage starts
+STAGE_PROGRESS = {"transcribe": 0.05, "chunk": 0.7, "index": 0.8}
+HEARTBEAT_SECONDS = 15.0
+LEASE_SECONDS = 60.0
+SPAWN_DEBOUNCE = 10.0  # a just-started worker may not hold the lease yet
+
+_SPAWN = {"proc": None, "at": 0.0}
+_SPAWN_LOCK = threading.Lock()
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@contextmanager
+def writer_lease(queue=None, holder: str | None = None):
+    """
+    Hold the single-writer lease for the block, renewed in the background.
+    Yields False (and holds nothing) if another live writer has it.
+    """
+    queue = queue or get_job_queue()
+    holder = holder or worker_id()
+    if not queue.acquire_lease(holder, LEASE_SECONDS):
+        yield False
+        return
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            queue.acquire_lease(holder, LEASE_SECONDS)
+
+    threading.Thread(target=renew, name="writer-lease", daemon=True).start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        queue.release_lease(holder)
+
+
+def _finish(job: dict, queue, episode_id=None, error=None) -> str:
+    if error is not None:
+        state = queue.fail(job["id"], error)
+        print(f"[job {job['id']}] {job['title']}: failed ({error}); now {state}", flush=True)
+        return state
+    queue.complete(job["id"], episode_id or "")
+    print(f"[job {job['id']}] {job['title']}: done ({episode_id or job['kind']})", flush=True)
+    return "done"
+
+
+def run_job(job: dict, queue=None) -> str:
+    """Run one claimed job to completion; returns the job's new state."""
+    from .batch import prepare_episode, write_episode
+    from .embed_index import delete_episode, wipe_index
+
+    queue = queue or get_job_queue()
+
+    def on_stage(stage):
+        queue.progress(job["id"], stage, STAGE_PROGRESS[stage])
+
+    try:
+        if job["kind"] == "wipe":
+            wipe_index()
+            return _finish(job, queue)
+        if job["kind"] == "delete":
+            delete_episode(job["file"])
+            return _finish(job, queue, job["file"])
+        prepared = prepare_episode(job["file"], job["title"], on_stage=on_stage)
+        on_stage("index")
+        write_episode(prepared)
+    except Exception as e:
+        return _finish(job, queue, error=f"{type(e).__name__}: {e}")
+    return _finish(job, queue, prepared["episode_id"])
+
+
+def run_ingest_jobs(jobs: list, queue=None) -> list:
+    """Run several claimed ingest jobs through batch.ingest_many (bounded prepare pool, one writer)."""
+    from .batch import ingest_many
+
+    queue = queue or get_job_queue()
+    stages = {"prepare": "transcribe", "index": "index"}
+
+    def progress(ev):
+        if ev["status"] == "running":
+            stage = stages[ev["stage"]]
+            queue.progress(jobs[ev["item"]]["id"], stage, STAGE_PROGRESS[stage])
+
+    results = ingest_many([(j["file"], j["title"]) for j in jobs], progress=progress)
+    return [_finish(j, queue, r["episode_id"], None if r["status"] == "ok" else r["error"] or r["status"])
+            for j, r in zip(jobs, results)]
+
+
+def _claim_batch(queue, me: str, size: int) -> list:
+    """
+    The oldest runnable job, plus up to size-1 ingests queued right behind it.
+    Claiming stops at the first delete/wipe, which then runs after the batch (queue order).
+    """
+    batch = []
+    while len(batch) < size:
+        job = queue.claim(me)
+        if job is None:
+            break
+        batch.append(job)
+        if job["kind"] != "ingest":
+            break
+    return batch
+
+
+def serve(poll: float = 1.0, once: bool = False, idle_exit: float | None = None) -> int:
+    from .batch import default_workers
+
+    queue = get_job_queue()
+    me = worker_id()
+    with writer_lease(queue, me) as ok:
+        if not ok:
+            print("Another worker holds the lease; exiting.", flush=True)
+            return 0
+
+        current = []
+        stop = threading.Event()
+
+        def beat():
+            # keeps the running jobs' heartbeats fresh during long stages
+            while not stop.wait(HEARTBEAT_SECONDS):
+                for job_id in list(current):
+                    queue.heartbeat(job_id)
+
+        threading.Thread(target=beat, name="worker-heartbeat", daemon=True).start()
+        idle_since = time.monotonic()
+        try:
+            while True:
+                queue.requeue_stale()
+                batch = _claim_batch(queue, me, default_workers())
+                if not batch:
+                    if once or (idle_exit and time.monotonic() - idle_since > idle_exit):
+                        return 0
+                    time.sleep(poll)
+                    continue
+                current[:] = [j["id"] for j in batch]
+                ingests = [j for j in batch if j["kind"] == "ingest"]
+                if len(ingests) > 1:
+                    run_ingest_jobs(ingests, queue)
+                else:
+                    # a single upload runs in-process: warm models, per-stage progress
+                    for job in ingests:
+                        run_job(job, queue)
+                for job in batch[len(ingests):]:
+                    run_job(job, queue)
+                current[:] = []
+                idle_since = time.monotonic()
+        finally:
+            stop.set()
+
+
+def ensure_worker(idle_exit: float = 300.0) -> bool:
+    """
+    Start a background worker (same interpreter, environment and working directory)
+    unless one is already alive. Returns True if a new one was started.
+    """
+    with _SPAWN_LOCK:
+        proc = _SPAWN["proc"]
+        if proc is not None and proc.poll() is None and time.monotonic() - _SPAWN["at"] < SPAWN_DEBOUNCE:
+            return False
+        if get_job_queue().lease_alive():
+            return False
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = os.environ.copy()
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (root, env.get("PYTHONPATH")) if p)
+        os.makedirs("storage", exist_ok=True)
+        # the child keeps its own copy of the descriptor
+        with open(os.path.join("storage", "worker.log"), "ab") as log:
+            _SPAWN["proc"] = subprocess.Popen(
+                [sys.executable, "-m", "pipeline.worker", "--idle-exit", str(idle_exit)],
+                cwd=os.getcwd(), env=env, stdout=log, stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        _SPAWN["at"] = time.monotonic()
+        return True
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run queued podcast ingestion jobs.")
+    ap.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    ap.add_argument("--poll", type=float, default=1.0, help="seconds between queue polls")
+    ap.add_argument("--idle-exit", type=float, default=None, help="exit after this many idle seconds")
+    args = ap.parse_args(argv)
+    return serve(poll=args.poll, once=args.once, idle_exit=args.idle_exit)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())